@@ -1,60 +1,87 @@
 """
 Утилиты для администрирования бота
+
+Использование: python admin.py <команда> [опции]
+
+Команды:
+  stats          Показать статистику операций (--days, по умолчанию 7)
+  cleanup-logs   Очистить старые логи (--days, по умолчанию 30)
+  force-cleanup  Принудительная очистка временных файлов
+  disk-usage     Показать использование диска
+  export-logs    Экспортировать логи (--output, --days, --jsonl)
+
+Опции:
+  --days N       Количество дней для статистики/очистки/экспорта
+  --output FILE  Файл для экспорта логов (.gz/.zst - со сжатием)
+  --jsonl        Экспортировать в формате JSON Lines (одна запись на строку)
 """
 import sys
 import os
+import functools
 
 # Добавляем путь к модулям
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.torrent_logger import torrent_logger
-from src.cleanup_manager import CleanupManager
-import json
+
+@functools.lru_cache(maxsize=1)
+def _cleanup_manager():
+    """Общий экземпляр CleanupManager на время работы процесса"""
+    from src.cleanup_manager import CleanupManager
+    return CleanupManager()
 
 
 def show_stats(days=7):
     """Показать статистику операций"""
+    from src.torrent_logger import torrent_logger
     stats = torrent_logger.get_operation_stats(days)
     
-    print(f"📊 Статистика за последние {days} дней:")
-    print(f"Всего операций: {stats.get('total_operations', 0)}")
+    if not stats.get('total_operations'):
+        print(f"📊 За последние {days} дней операций не было")
+        return
     
-    print("\n📈 По типам операций:")
-    for op_type, count in stats.get('operations_by_type', {}).items():
-        print(f"  {op_type}: {count}")
+    # Собираем отчёт целиком и выводим одной записью
+    out = [
+        f"📊 Статистика за последние {days} дней:\n",
+        f"Всего операций: {stats.get('total_operations', 0)}\n",
+        "\n📈 По типам операций:\n",
+    ]
+    out.extend(f"  {op_type}: {count}\n"
+               for op_type, count in stats.get('operations_by_type', {}).items())
     
-    print("\n📋 По статусам:")
-    for status, count in stats.get('operations_by_status', {}).items():
-        print(f"  {status}: {count}")
+    out.append("\n📋 По статусам:\n")
+    out.extend(f"  {status}: {count}\n"
+               for status, count in stats.get('operations_by_status', {}).items())
     
-    print("\n👥 Активные пользователи:")
-    for user in stats.get('active_users', []):
-        print(f"  {user['user_name']} (ID: {user['user_id']}): {user['count']} операций")
+    out.append("\n👥 Активные пользователи:\n")
+    out.extend(f"  {user['user_name']} (ID: {user['user_id']}): {user['count']} операций\n"
+               for user in stats.get('active_users', []))
     
     total_size = stats.get('total_transferred_bytes', 0)
     if total_size > 0:
-        size_gb = total_size / (1024**3)
-        print(f"\n💾 Передано данных: {size_gb:.2f} ГБ")
+        size_gb = total_size / (1 << 30)
+        out.append(f"\n💾 Передано данных: {size_gb:.2f} ГБ\n")
+    
+    sys.stdout.write("".join(out))
 
 
 def cleanup_logs(days=30):
     """Очистить старые логи"""
+    from src.torrent_logger import torrent_logger
     print(f"🗑️ Очистка логов старше {days} дней...")
-    torrent_logger.cleanup_old_logs(days)
-    print("✅ Очистка завершена")
+    deleted_count = torrent_logger.cleanup_old_logs(days)
+    print(f"✅ Очистка завершена, удалено записей: {deleted_count}")
 
 
 def force_cleanup():
     """Принудительная очистка временных файлов"""
     print("🗑️ Запуск принудительной очистки...")
-    cleanup_manager = CleanupManager()
-    cleanup_manager.force_cleanup()
+    _cleanup_manager().force_cleanup()
     print("✅ Принудительная очистка завершена")
 
 
 def disk_usage():
     """Показать использование диска"""
-    cleanup_manager = CleanupManager()
+    cleanup_manager = _cleanup_manager()
     stats = cleanup_manager.get_disk_usage_stats()
     
     print("💾 Использование дискового пространства:")
@@ -66,42 +93,89 @@ def disk_usage():
     print(f"Свободно: {cleanup_manager.format_size(stats.get('free_space', 0))}")
 
 
-def export_logs(output_file="logs_export.json", days=30):
-    """Экспортировать логи в JSON"""
+def export_logs(output_file="logs_export.json", days=30, jsonl=False):
+    """Экспортировать логи в JSON (или JSON Lines при jsonl=True)"""
+    from src.torrent_logger import torrent_logger
     print(f"📤 Экспорт логов за {days} дней в {output_file}...")
-    success = torrent_logger.export_logs_to_json(output_file, days)
+    success = torrent_logger.export_logs_to_json(output_file, days, jsonl=jsonl)
     if success:
         print("✅ Экспорт завершён успешно")
     else:
         print("❌ Ошибка экспорта")
 
 
+# Команды утилиты: имя -> (обработчик, опции, которые он принимает)
+COMMANDS = {
+    "stats": (show_stats, ("days",)),
+    "cleanup-logs": (cleanup_logs, ("days",)),
+    "force-cleanup": (force_cleanup, ()),
+    "disk-usage": (disk_usage, ()),
+    "export-logs": (export_logs, ("output_file", "days", "jsonl")),
+}
+
+# Опции: флаг -> (аргумент обработчика, преобразование значения или None для флага без значения)
+OPTIONS = {
+    "--days": ("days", int),
+    "--output": ("output_file", str),
+    "--jsonl": ("jsonl", None),
+}
+
+
+def _fail(message):
+    """Сообщить об ошибке в аргументах и завершиться с кодом 2"""
+    sys.stderr.write(f"admin.py: ошибка: {message}\nСправка: python admin.py --help\n")
+    sys.exit(2)
+
+
+def _parse_options(command, args):
+    """Разобрать опции команды в именованные аргументы обработчика"""
+    allowed = COMMANDS[command][1]
+    kwargs = {}
+    args = iter(args)
+    
+    for arg in args:
+        if arg in ("-h", "--help"):
+            print(__doc__.strip())
+            sys.exit(0)
+        
+        flag, has_value, value = arg.partition("=")
+        name, convert = OPTIONS.get(flag, (None, None))
+        if name not in allowed:
+            _fail(f"неизвестная опция для {command}: {flag}")
+        
+        if convert is None:
+            if has_value:
+                _fail(f"опция {flag} не принимает значение")
+            kwargs[name] = True
+            continue
+        
+        if not has_value:
+            value = next(args, None)
+            # Следующая опция вместо значения (--output --days 3) - значение пропущено
+            if value is None or value.startswith("--"):
+                _fail(f"опция {flag} требует значение")
+        
+        try:
+            kwargs[name] = convert(value)
+        except ValueError:
+            _fail(f"неверное значение для {flag}: {value}")
+    
+    return kwargs
+
+
 def main():
     """Главная функция утилиты"""
-    import argparse
+    argv = sys.argv[1:]
+    if not argv or argv[0] in ("-h", "--help"):
+        print(__doc__.strip())
+        return
     
-    parser = argparse.ArgumentParser(description="Утилиты администрирования TorrentBot")
-    parser.add_argument("command", choices=[
-        "stats", "cleanup-logs", "force-cleanup", "disk-usage", "export-logs"
-    ], help="Команда для выполнения")
-    parser.add_argument("--days", type=int, default=7, 
-                       help="Количество дней для статистики/очистки")
-    parser.add_argument("--output", default="logs_export.json",
-                       help="Файл для экспорта логов")
+    command = argv[0]
+    if command not in COMMANDS:
+        _fail(f"неизвестная команда: {command}")
     
-    args = parser.parse_args()
-    
-    if args.command == "stats":
-        show_stats(args.days)
-    elif args.command == "cleanup-logs":
-        cleanup_logs(args.days)
-    elif args.command == "force-cleanup":
-        force_cleanup()
-    elif args.command == "disk-usage":
-        disk_usage()
-    elif args.command == "export-logs":
-        export_logs(args.output, args.days)
-
+    handler = COMMANDS[command][0]
+    handler(**_parse_options(command, argv[1:]))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
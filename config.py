@@ -2,27 +2,55 @@
 Конфигурация для Telegram-бота торрентов
 """
 import os
-from typing import List
+import sys
+import functools
+from pathlib import Path
+from types import MappingProxyType
+from string import Formatter
+from typing import Dict, FrozenSet, Optional, Tuple
 
 # Базовая директория проекта
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = Path(__file__).resolve().parent
+
 
 # Telegram Bot API
-BOT_TOKEN = os.getenv("BOT_TOKEN", "6510728909:AAEZq4Vf35TBTIk_G2hH-RrF4oOYazYs0Ms")
+@functools.lru_cache(maxsize=1)
+def get_bot_token() -> str:
+    """Получить токен бота из переменной окружения (читается один раз)"""
+    token = os.environ.get("BOT_TOKEN")
+    if not token:
+        raise RuntimeError("BOT_TOKEN не установлен")
+    return token
+
 
-# Авторизованные пользователи (ID Telegram)
-AUTHORIZED_USERS: List[int] = [
+# Авторизованные пользователи (ID Telegram) в порядке добавления
+AUTHORIZED_USERS_ORDERED: Tuple[int, ...] = (
     # Добавьте свой Telegram ID здесь
     # 123456789,
     906893530,
     6221642254,
+)
+
+# Множество для проверки доступа за O(1)
+AUTHORIZED_USERS: FrozenSet[int] = frozenset(AUTHORIZED_USERS_ORDERED)
 
-]
+# Связанный метод проверки для горячих путей
+is_authorized_user = AUTHORIZED_USERS.__contains__
 
 # Пути к директориям
-DOWNLOADS_DIR = os.path.join(BASE_DIR, "downloads")
-TEMP_DIR = os.path.join(BASE_DIR, "temp")
-LOGS_DIR = os.path.join(BASE_DIR, "logs")
+DOWNLOADS_DIR = BASE_DIR / "downloads"
+TEMP_DIR = BASE_DIR / "temp"
+LOGS_DIR = BASE_DIR / "logs"
+
+# Строковые версии путей для API, которые принимают только str
+DOWNLOADS_DIR_STR = str(DOWNLOADS_DIR)
+TEMP_DIR_STR = str(TEMP_DIR)
+LOGS_DIR_STR = str(LOGS_DIR)
+
+# Создаём директории один раз при импорте, чтобы потребителям не нужно было это проверять
+for _directory in (DOWNLOADS_DIR, TEMP_DIR, LOGS_DIR):
+    _directory.mkdir(exist_ok=True)
+del _directory
 
 # Настройки торрент-клиента (qBittorrent)
 QBITTORRENT_HOST = "45.153.71.119"
@@ -31,10 +59,21 @@ QBITTORRENT_USERNAME = "tbate"
 QBITTORRENT_PASSWORD = "aqwsderf"
 
 # Настройки Userbot для обхода ограничений
-USERBOT_API_ID = os.getenv("USERBOT_API_ID", "24073458")  # Получить на https://my.telegram.org
-USERBOT_API_HASH = os.getenv("USERBOT_API_HASH", "717a1a4a14165bd46f9e066ee639a63f")  # Получить на https://my.telegram.org
-USERBOT_PHONE = os.getenv("USERBOT_PHONE", "+992004550737")  # Номер телефона userbot
-USERBOT_STORAGE_CHAT_ID = os.getenv("USERBOT_STORAGE_CHAT_ID", "6690844057")  # ID промежуточного чата/канала
+@functools.lru_cache(maxsize=1)
+def get_userbot_credentials() -> Dict[str, Optional[str]]:
+    """
+    Получить учётные данные userbot из переменных окружения (читаются один раз)
+    
+    USERBOT_API_ID и USERBOT_API_HASH можно получить на https://my.telegram.org
+    """
+    return {
+        "api_id": os.environ.get("USERBOT_API_ID"),
+        "api_hash": os.environ.get("USERBOT_API_HASH"),
+        "phone": os.environ.get("USERBOT_PHONE"),  # Номер телефона userbot
+        "storage_chat_id": os.environ.get("USERBOT_STORAGE_CHAT_ID"),  # ID промежуточного чата/канала
+    }
+
+
 USERBOT_SESSION_NAME = os.getenv("USERBOT_SESSION_NAME", "userbot_session")
 USERBOT_WORKDIR = os.getenv("USERBOT_WORKDIR", "sessions")
 USERBOT_MAX_FILE_SIZE = int(os.getenv("USERBOT_MAX_FILE_SIZE", 2 * 1024 * 1024 * 1024))  # 2 ГБ
@@ -48,26 +87,55 @@ MAX_DISK_USAGE = 50 * 1024 * 1024 * 1024  # 50 ГБ максимальное и
 LOG_LEVEL = "INFO"
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
+# Общие префиксы сообщений
+_OK = "✅ "
+_ERR = "❌ "
+
 # Сообщения для пользователей
 MESSAGES = {
-    "unauthorized": "❌ У вас нет доступа к этому боту.",
+    "unauthorized": _ERR + "У вас нет доступа к этому боту.",
     "start": "🤖 Привет! Отправьте мне торрент-файл или magnet-ссылку для скачивания.",
     "processing": "⏳ Обрабатываю торрент...",
     "downloading": "📥 Скачиваю: {name} ({progress}%)",
-    "download_complete": "✅ Скачивание завершено: {name}",
+    "download_complete": _OK + "Скачивание завершено: {name}",
     "preparing_files": "📦 Подготавливаю файлы для отправки...",
     "splitting_file": "✂️ Разделяю большой файл: {name}",
     "sending_file": "📤 Отправляю файл: {name}",
-    "file_sent": "✅ Файл отправлен: {name}",
+    "file_sent": _OK + "Файл отправлен: {name}",
     "split_instructions": "📁 Файл был разделён на {parts} частей.\n"
                          "Для восстановления используйте 7-Zip, открыв файл {first_part}",
-    "error": "❌ Произошла ошибка: {error}",
+    "error": _ERR + "Произошла ошибка: {error}",
     "disk_full": "💾 Недостаточно места на диске. Попробуйте позже.",
     "cleanup": "🗑️ Очищаю временные файлы...",
-    "qbittorrent_unavailable": "❌ qBittorrent недоступен. Проверьте подключение.",
-    "admin_only": "❌ Только администраторы могут выполнять эту команду.",
-    "user_added": "✅ Пользователь {user_id} добавлен с ролью {role}",
-    "user_removed": "✅ Пользователь {user_id} удален",
-    "user_promoted": "✅ Пользователь {user_id} повышен до администратора",
-    "user_demoted": "✅ Пользователь {user_id} понижен до обычного пользователя"
-}
\ No newline at end of file
+    "qbittorrent_unavailable": _ERR + "qBittorrent недоступен. Проверьте подключение.",
+    "admin_only": _ERR + "Только администраторы могут выполнять эту команду.",
+    "user_added": _OK + "Пользователь {user_id} добавлен с ролью {role}",
+    "user_removed": _OK + "Пользователь {user_id} удален",
+    "user_promoted": _OK + "Пользователь {user_id} повышен до администратора",
+    "user_demoted": _OK + "Пользователь {user_id} понижен до обычного пользователя"
+}
+
+# Сообщения без параметров интернируем: они отправляются как есть.
+# Словарь доступен только для чтения, чтобы его нельзя было случайно изменить.
+MESSAGES = MappingProxyType({
+    key: sys.intern(text) if "{" not in text else text
+    for key, text in MESSAGES.items()
+})
+
+# Шаблоны сообщений, разобранные один раз при импорте
+_PARSED_MESSAGES = {
+    key: tuple(Formatter().parse(template)) for key, template in MESSAGES.items()
+}
+
+
+def render(key: str, **kwargs) -> str:
+    """Подставить параметры в сообщение из MESSAGES без повторного разбора шаблона"""
+    parts = _PARSED_MESSAGES[key]
+    if len(parts) == 1 and parts[0][1] is None:
+        # Сообщение без параметров
+        return MESSAGES[key]
+    
+    return "".join(
+        literal + (format(kwargs[field], spec) if field is not None else "")
+        for literal, field, spec, _ in parts
+    )
@@ -2,15 +2,24 @@
 Основной файл Telegram-бота для скачивания торрентов
 """
 import os
-import sys
+import atexit
 import logging
+import logging.handlers
+import queue
 import asyncio
 import re
-from io import BytesIO
-from typing import Optional
+import base64
+import time
+import html
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlsplit
+from typing import Optional, Tuple
 
 from telegram import Update, Document
 from telegram.ext import (
+    AIORateLimiter,
     ApplicationBuilder, 
     CommandHandler, 
     MessageHandler, 
@@ -18,41 +27,262 @@ from telegram.ext import (
     ContextTypes
 )
 from telegram.constants import ParseMode
-
-# Добавляем путь к модулям
-sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+from telegram.error import BadRequest
 
 from config import (
-    BOT_TOKEN, AUTHORIZED_USERS, TEMP_DIR, LOGS_DIR,
-    LOG_LEVEL, LOG_FORMAT, MESSAGES
+    get_bot_token, AUTHORIZED_USERS, TEMP_DIR, LOGS_DIR,
+    LOG_LEVEL, LOG_FORMAT, MESSAGES, is_authorized_user, render
 )
-
-# Константы Telegram
-MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2 ГБ - лимит для userbot
-from src.torrent_client import TorrentClient
+from src.torrent_client import TorrentClient, POLL_INTERVAL
 from src.file_manager import FileManager
 from src.cleanup_manager import CleanupManager
 from src.torrent_logger import torrent_logger
 from src.user_manager import user_manager
-from src.progress_bar import progress_tracker
+from src.progress_bar import ProgressBar, progress_tracker
 from src.file_sender import SmartFileSender
+from src.util import BOT_API_FILE_LIMIT, upload_payload
+
+# Константы Telegram
+MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2 ГБ - лимит для userbot
+MAX_TORRENT_FILE_SIZE = 10 * 1024 * 1024  # 10 МБ - больше .torrent-файлы не бывают, не скачиваем их в память
+PART_UPLOAD_CONCURRENCY = 4  # Сколько частей архива отправляется одновременно (не больше, чем позволяет бюджет памяти)
+PART_UPLOAD_MEMORY_BUDGET = 256 * 1024 * 1024  # 256 МБ - сколько байт частей одновременно держат загрузки одного файла
+UPLOAD_CONCURRENCY = 8  # Сколько документов бот загружает одновременно для всех пользователей
+MONITOR_POOL_SIZE = 8  # Потоки для опроса qBittorrent при мониторинге скачиваний
+STATS_CACHE_TTL = 30.0  # Сколько секунд /stats отвечает из кэша, не пересчитывая статистику
+STATUS_CHUNK_LIMIT = 4040  # Длина части /status в UTF-16 с запасом под заголовок (лимит Telegram 4096)
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024  # Размер bot.log, после которого файл ротируется
+LOG_FILE_BACKUP_COUNT = 5  # Сколько старых файлов bot.log хранить
 
-# Гарантируем наличие директории логов до настройки логгера
-os.makedirs(LOGS_DIR, exist_ok=True)
+# Настройка логирования: обработчики только ставят запись в очередь, а запись в файл
+# и консоль выполняет отдельный поток QueueListener, не задерживая цикл событий
+_log_formatter = logging.Formatter(LOG_FORMAT)
+_log_handlers = [
+    logging.handlers.RotatingFileHandler(
+        os.path.join(LOGS_DIR, 'bot.log'),
+        maxBytes=LOG_FILE_MAX_BYTES,
+        backupCount=LOG_FILE_BACKUP_COUNT,
+        encoding='utf-8'
+    ),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
 
-# Настройка логирования
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format=LOG_FORMAT,
-    handlers=[
-        logging.FileHandler(os.path.join(LOGS_DIR, 'bot.log'), encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+_log_queue = queue.SimpleQueue()
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# QueueHandler подставляет в запись только текст сообщения, LOG_FORMAT применяют обработчики слушателя
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=getattr(logging, LOG_LEVEL), handlers=[_queue_handler])
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_log_listener.start()
+# При выходе дописываем оставшиеся в очереди записи
+atexit.register(_log_listener.stop)
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True)
+class ActiveDownload:
+    """Активное скачивание пользователя"""
+    torrent_hash: str
+    operation_id: Optional[int]
+
+
+# Значение параметра xt magnet-ссылки: инфо-хеш BitTorrent v1 (hex или base32) или v2 (multihash sha256).
+# Гибридная ссылка содержит оба
+_MAGNET_XT_RE = re.compile(
+    r'urn:bt(?:ih:(?P<btih>[0-9A-Fa-f]{40}|[A-Za-z2-7]{32})|mh:1220(?P<btmh>[0-9A-Fa-f]{64}))'
+)
+
+# Заголовок /status, когда ответ помещается в одно сообщение (разметка HTML)
+_STATUS_HEADER = "📊 <b>Статус торрентов</b>\n\n"
+
+# Группа в /status для каждого состояния qBittorrent (остальные состояния не показываются)
+_STATUS_BUCKETS = {
+    'downloading': 'downloading', 'stalledDL': 'downloading', 'queuedDL': 'downloading',
+    'uploading': 'uploading', 'stalledUP': 'uploading', 'queuedUP': 'uploading',
+    'pausedDL': 'paused', 'pausedUP': 'paused',
+    'error': 'errors', 'missingFiles': 'errors',
+}
+
+# Заголовки разделов /status и шаблоны строк торрентов в них (имена подставляются после html.escape)
+_STATUS_HDR_DOWNLOADING = "⬇️ <b>Скачиваются:</b>"
+_STATUS_HDR_COMPLETED = "✅ <b>Завершены:</b>"
+_STATUS_HDR_UPLOADING = "⬆️ <b>Раздаются:</b>"
+_STATUS_HDR_PAUSED = "⏸️ <b>Приостановлены:</b>"
+_STATUS_HDR_ERRORS = "❌ <b>Ошибки:</b>"
+_STATUS_ROW_DOWNLOADING = "<code>{bar}</code>\n📁 {name}\n⚡ {speed}\n"
+_STATUS_ROW_COMPLETED = "📁 {name}\n💾 {size} | 📤 Рейтинг: {ratio:.2f}\n"
+_STATUS_ROW_UPLOADING = "📁 {name}\n⚡ {speed}\n"
+_STATUS_ROW_PAUSED = "📁 {name} ({progress:.1f}%)"
+_STATUS_ROW_ERRORS = "� {name}"
+
+# Бар для /status: состояние трекера (время старта, обновления) для отрисовки строки не нужно
+_STATUS_PROGRESS_BAR = ProgressBar()
+
+# Специальные символы Markdown и таблица их экранирования для str.translate
+_MD_SPECIAL_CHARS = frozenset('_*[]()~`>#+-=|{}.!')
+_MD_ESCAPE_TABLE = str.maketrans({char: '\\' + char for char in _MD_SPECIAL_CHARS})
+
+
+def _utf16_len(text: str) -> int:
+    """Длина строки в кодовых единицах UTF-16, в которых Telegram считает лимит сообщения"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _magnet_info_hashes(link: str) -> Tuple[str, ...]:
+    """
+    Возможные идентификаторы торрента в qBittorrent (hex, нижний регистр) по magnet-ссылке:
+    хеш v1 и первые 40 символов хеша v2 - под ним qBittorrent показывает торренты v2
+    и гибридные. Пустой кортеж - в ссылке нет ни одного корректного xt
+    """
+    hashes = []
+    # Раскодируются только значения настоящих параметров xt (xt, xt.1, ...): закодированный
+    # "&xt=" внутри dn или другого параметра не должен добавлять хеш
+    for key, value in parse_qsl(urlsplit(link).query):
+        if key != 'xt' and not key.startswith('xt.'):
+            continue
+        match = _MAGNET_XT_RE.fullmatch(value)
+        if match is None:
+            continue
+        btih, btmh = match.group('btih', 'btmh')
+        if btmh is not None:
+            hashes.append(btmh[:40].lower())
+        elif len(btih) == 40:
+            hashes.append(btih.lower())
+        else:
+            hashes.append(base64.b32decode(btih.upper()).hex())
+    # Один и тот же хеш может быть записан в ссылке дважды (hex и base32)
+    return tuple(dict.fromkeys(hashes))
+
+
+def _part_upload_concurrency(part_size: int) -> int:
+    """
+    Сколько частей архива загружать одновременно: PTB держит загружаемую часть в памяти
+    целиком, поэтому части по SPLIT_CHUNK_SIZE (1.9 ГБ) идут по одной, а мелкие - параллельно
+    """
+    return max(1, min(PART_UPLOAD_CONCURRENCY, PART_UPLOAD_MEMORY_BUDGET // max(part_size, 1)))
+
+
+def _clip(text: str, limit: int) -> str:
+    """Обрезать строку до limit символов, заменив хвост многоточием"""
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+@functools.lru_cache(maxsize=1024)
+def _status_bar(progress: float) -> str:
+    """Прогресс-бар для /status (зависит только от процента, поэтому кэшируется)"""
+    return _STATUS_PROGRESS_BAR.create_bar(progress)
+
+
+@functools.lru_cache(maxsize=4096)
+def _escape_markdown(text: str) -> str:
+    """Экранировать специальные символы для Markdown (с кэшем для повторяющихся имён)"""
+    if not text:
+        return "Unknown"
+    
+    # Быстрый путь: если спецсимволов нет, строку не нужно пересобирать
+    if _MD_SPECIAL_CHARS.isdisjoint(text):
+        return text
+    
+    return text.translate(_MD_ESCAPE_TABLE)
+
+
+def _render_user(user: dict) -> str:
+    """Строка пользователя для /listusers"""
+    name = user['first_name'] or "Неизвестно"
+    username = f"@{user['username']}" if user['username'] else ""
+    return f"• {user['user_id']} - {name} {username}\n"
+
+
+_INVALID_USER_ID_MSG = "❌ Неверный ID пользователя. Используйте числовой ID."
+
+
+def _parse_user_id(arg: str) -> Optional[int]:
+    """Разобрать ID пользователя из аргумента команды (None, если это не число)"""
+    try:
+        return int(arg)
+    except ValueError:
+        return None
+
+
+def _err(error: str) -> str:
+    """Сообщение об ошибке по шаблону MESSAGES["error"]"""
+    return render("error", error=error)
+
+
+# Сообщения об ошибках с постоянным текстом: шаблон подставляется один раз при импорте
+_ERR_NO_FILES = _err("Не найдены скачанные файлы")
+_ERR_SPLIT_FAILED = _err("Не удалось разбить файл")
+_ERR_STATS_FAILED = _err("Не удалось получить статистику")
+_ERR_CLEANUP_FAILED = _err("Ошибка при очистке")
+
+# Текст /help собирается один раз: для пользователей и для администраторов
+_HELP_COMMANDS = (
+    "🤖 **Команды бота:**\n\n"
+    "📥 **Основные команды:**\n"
+    "/start - Начать работу с ботом\n"
+    "/status - Статус активных загрузок\n"
+    "/stats - Статистика бота\n"
+    "/cleanup - Очистка временных файлов\n"
+    "/help - Показать эту справку\n\n"
+)
+_HELP_ADMIN_COMMANDS = (
+    "👑 **Команды администратора:**\n"
+    "/adduser <id> [role] - Добавить пользователя\n"
+    "/removeuser <id> - Удалить пользователя\n"
+    "/listusers - Список пользователей\n"
+    "/promote <id> - Повысить до админа\n"
+    "/demote <id> - Понизить до пользователя\n\n"
+)
+_HELP_USAGE = (
+    "📁 **Использование:**\n"
+    "• Отправьте .torrent файл\n"
+    "• Отправьте magnet-ссылку\n\n"
+    "Файлы > 2 ГБ будут автоматически разбиты на части."
+)
+_HELP_USER = _HELP_COMMANDS + _HELP_USAGE
+_HELP_ADMIN = _HELP_COMMANDS + _HELP_ADMIN_COMMANDS + _HELP_USAGE
+
+
+def require_auth(func):
+    """Декоратор: выполнить обработчик только для авторизованных пользователей"""
+    @functools.wraps(func)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.check_authorization(update, context):
+            await update.message.reply_text(MESSAGES["unauthorized"])
+            return
+        return await func(self, update, context)
+    return wrapper
+
+
+def admin_only(denied: str = MESSAGES["admin_only"]):
+    """Декоратор: выполнить команду только для администраторов, остальным ответить denied"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if not self._is_admin(update, context):
+                await update.message.reply_text(denied)
+                return
+            return await func(self, update, context)
+        return wrapper
+    return decorator
+
+
+def requires_args(usage: str):
+    """Декоратор: показать подсказку по использованию, если аргументы команды не переданы"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if not context.args:
+                await update.message.reply_text(usage)
+                return
+            return await func(self, update, context)
+        return wrapper
+    return decorator
+
+
 class TorrentBot:
     """Основной класс Telegram-бота"""
     
@@ -60,28 +290,51 @@ class TorrentBot:
         self.torrent_client = TorrentClient()
         self.file_manager = FileManager()
         self.cleanup_manager = CleanupManager()
-        self.active_downloads = {}  # {user_id: torrent_hash}
+        self.active_downloads = {}  # {user_id: ActiveDownload}
         self.application = None  # Будет установлено в main()
         self.smart_file_sender = None  # Будет инициализирован после создания application
+        self.background_tasks = set()  # Фоновые задачи отправки файлов
+        self.monitor_tasks = set()  # Задачи мониторинга скачиваний (отменяются при остановке)
+        self.stats_cache = None  # (момент по time.monotonic, статистика операций, статистика диска) для /stats
+        # Общий лимит одновременных загрузок документов; паузы между сообщениями
+        # и повтор после RetryAfter выполняет AIORateLimiter приложения
+        self.upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        # Отдельный пул для опроса qBittorrent, чтобы мониторинг не занимал
+        # стандартный пул цикла событий (чтение файлов, DNS и т.п.)
+        self.monitor_pool = ThreadPoolExecutor(
+            max_workers=MONITOR_POOL_SIZE, thread_name_prefix='torrent-monitor'
+        )
+        self.cleanup_task = None  # Планировщик очистки, запускается в post_init
         
-        # Запускаем планировщик очистки
-        self.cleanup_manager.start_cleanup_scheduler(interval_hours=2)
-        
-    def check_authorization(self, user_id: int) -> bool:
+    def _get_user_role(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+        """Роль пользователя из БД: запрашивается не больше одного раза на обновление Telegram"""
+        cached = context.user_data.get('_role')
+        if cached is None or cached[0] != update.update_id:
+            cached = (update.update_id, user_manager.get_role(update.effective_user.id))
+            context.user_data['_role'] = cached
+        return cached[1]
+    
+    def _is_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Проверить, является ли автор обновления администратором"""
+        return self._get_user_role(update, context) == 'admin'
+    
+    def check_authorization(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Проверить авторизацию пользователя"""
+        user_id = update.effective_user.id
+        
         # Сначала проверяем через новую систему управления пользователями
-        if user_manager.is_authorized(user_id):
+        if self._get_user_role(update, context) is not None:
             user_manager.update_last_active(user_id)
             return True
         
         # Фолбэк на старую систему (для совместимости)
-        return user_id in AUTHORIZED_USERS
+        return is_authorized_user(user_id)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user_id = update.effective_user.id
         
-        if not self.check_authorization(user_id):
+        if not self.check_authorization(update, context):
             await update.message.reply_text(MESSAGES["unauthorized"])
             logger.warning(f"Неавторизованный доступ от пользователя {user_id}")
             return
@@ -89,14 +342,9 @@ class TorrentBot:
         await update.message.reply_text(MESSAGES["start"])
         logger.info(f"Пользователь {user_id} запустил бота")
     
+    @require_auth
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик загружаемых документов"""
-        user_id = update.effective_user.id
-        
-        if not self.check_authorization(user_id):
-            await update.message.reply_text(MESSAGES["unauthorized"])
-            return
-        
         document: Document = update.message.document
         
         # Проверяем, что это торрент-файл
@@ -104,67 +352,36 @@ class TorrentBot:
             await update.message.reply_text("❌ Пожалуйста, отправьте файл с расширением .torrent")
             return
         
-        try:
-            status_message = await update.message.reply_text("⏳ Обрабатываю торрент-файл...")
-            
-            # Проверяем подключение к qBittorrent
-            if not self.torrent_client.is_connected():
-                await status_message.edit_text(
-                    "❌ qBittorrent недоступен. Убедитесь, что:\n"
-                    "1. qBittorrent запущен\n"
-                    "2. Web UI включен в настройках\n"
-                    "3. Правильно настроены хост и порт в config.py"
-                )
-                return
-            
-            # Логируем начало операции
-            user_name = update.effective_user.first_name or "Unknown"
-            
-            # Скачиваем файл
-            file = await context.bot.get_file(document.file_id)
-            torrent_data = BytesIO()
-            await file.download_to_memory(torrent_data)
-            
-            # Добавляем торрент в клиент
-            torrent_hash = self.torrent_client.add_torrent_file(
-                torrent_data.getvalue(), 
-                document.file_name
-            )
-            
-            if torrent_hash:
-                # Логируем успешное добавление
-                operation_id = torrent_logger.log_download_started(
-                    user_id, user_name, torrent_hash, document.file_name
-                )
-                
-                self.active_downloads[user_id] = {
-                    'torrent_hash': torrent_hash,
-                    'operation_id': operation_id
-                }
-                
-                await status_message.edit_text(f"✅ Торрент добавлен! Hash: `{torrent_hash}`")
-                
-                # Запускаем мониторинг с прогресс-баром
-                await self._start_download_monitoring(torrent_hash, update.effective_chat.id)
-            else:
-                await status_message.edit_text(
-                    "❌ Не удалось добавить торрент"
-                )
-                
-        except Exception as e:
-            logger.error(f"Ошибка обработки торрент-файла: {e}")
+        # Размер известен из обновления - отсекаем заведомо не торрент-файлы до скачивания
+        if document.file_size and document.file_size > MAX_TORRENT_FILE_SIZE:
             await update.message.reply_text(
-                MESSAGES["error"].format(error=str(e))
+                f"❌ Слишком большой торрент-файл (максимум {MAX_TORRENT_FILE_SIZE // (1024 * 1024)} МБ)"
             )
+            return
+        
+        async def add_torrent() -> Optional[str]:
+            # Содержимое .torrent живёт только в кадре этой корутины и освобождается
+            # сразу после добавления, а не удерживается до конца мониторинга скачивания.
+            # Скачиваем файл сразу в bytearray, без лишней копии через BytesIO.getvalue()
+            file = await context.bot.get_file(document.file_id)
+            torrent_data = await file.download_as_bytearray()
+            # Добавление ждёт появления торрента в qBittorrent (time.sleep) - выполняем в потоке
+            return await asyncio.to_thread(
+                self.torrent_client.add_torrent_file, torrent_data, document.file_name
+            )
+        
+        await self._add_torrent_and_monitor(
+            update,
+            torrent_name=document.file_name,
+            add_torrent=add_torrent,
+            progress_text="⏳ Обрабатываю торрент-файл...",
+            failure_text="❌ Не удалось добавить торрент",
+            error_context="Ошибка обработки торрент-файла"
+        )
     
+    @require_auth
     async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений (magnet-ссылки)"""
-        user_id = update.effective_user.id
-        
-        if not self.check_authorization(user_id):
-            await update.message.reply_text(MESSAGES["unauthorized"])
-            return
-        
         text = update.message.text.strip()
         
         # Проверяем, что это magnet-ссылка
@@ -174,11 +391,43 @@ class TorrentBot:
             )
             return
         
+        # Отсекаем некорректные ссылки до обращения к qBittorrent. Значения xt могут прийти
+        # закодированными (xt=urn%3Abtih%3A...) - они раскодируются по отдельности,
+        # а в qBittorrent ссылка передаётся как есть. Хеши из ссылки позволяют найти
+        # добавленный торрент без сравнения списков
+        info_hashes = _magnet_info_hashes(text)
+        if not info_hashes:
+            await update.message.reply_text(
+                "❌ Некорректная magnet-ссылка: не найден хеш торрента (xt=urn:btih:...)"
+            )
+            return
+        
+        async def add_torrent() -> Optional[str]:
+            # Добавление ждёт появления торрента в qBittorrent (time.sleep) - выполняем в потоке
+            return await asyncio.to_thread(self.torrent_client.add_magnet_link, text, info_hashes)
+        
+        await self._add_torrent_and_monitor(
+            update,
+            torrent_name="Magnet Link",
+            add_torrent=add_torrent,
+            progress_text="⏳ Добавляю торрент...",
+            failure_text="❌ Не удалось добавить магнет-ссылку",
+            error_context="Ошибка обработки magnet-ссылки"
+        )
+    
+    async def _add_torrent_and_monitor(self, update: Update, torrent_name: str, add_torrent,
+                                       progress_text: str, failure_text: str, error_context: str):
+        """
+        Общий путь для торрент-файлов и magnet-ссылок: проверка qBittorrent,
+        добавление торрента, логирование и запуск мониторинга
+        """
+        user_id = update.effective_user.id
+        
         try:
-            status_message = await update.message.reply_text("⏳ Добавляю торрент...")
+            status_message = await update.message.reply_text(progress_text)
             
             # Проверяем подключение к qBittorrent
-            if not self.torrent_client.is_connected():
+            if not await asyncio.to_thread(self.torrent_client.is_connected):
                 await status_message.edit_text(
                     "❌ qBittorrent недоступен. Убедитесь, что:\n"
                     "1. qBittorrent запущен\n"
@@ -190,40 +439,41 @@ class TorrentBot:
             # Логируем начало операции
             user_name = update.effective_user.first_name or "Unknown"
             
-            # Добавляем magnet-ссылку в клиент
-            torrent_hash = self.torrent_client.add_magnet_link(text)
+            # Добавляем торрент в клиент
+            torrent_hash = await add_torrent()
             
             if torrent_hash:
-                # Логируем успешное добавление
-                operation_id = torrent_logger.log_download_started(
-                    user_id, user_name, torrent_hash, "Magnet Link"
+                # Логируем успешное добавление (INSERT в SQLite - в потоке)
+                operation_id = await asyncio.to_thread(
+                    torrent_logger.log_download_started,
+                    user_id, user_name, torrent_hash, torrent_name
                 )
                 
-                self.active_downloads[user_id] = {
-                    'torrent_hash': torrent_hash,
-                    'operation_id': operation_id
-                }
+                self.active_downloads[user_id] = ActiveDownload(torrent_hash, operation_id)
                 
                 await status_message.edit_text(f"✅ Торрент добавлен! Hash: `{torrent_hash}`")
                 
-                # Запускаем мониторинг с прогресс-баром
-                await self._start_download_monitoring(torrent_hash, update.effective_chat.id)
+                # Запускаем мониторинг с прогресс-баром отдельной задачей: обработчик
+                # завершается сразу, а остановка бота не ждёт многочасовых скачиваний
+                self._create_monitor_task(torrent_hash, update.effective_chat.id)
             else:
-                await status_message.edit_text(
-                    "❌ Не удалось добавить магнет-ссылку"
-                )
+                await status_message.edit_text(failure_text)
                 
         except Exception as e:
-            logger.error(f"Ошибка обработки magnet-ссылки: {e}")
-            await update.message.reply_text(
-                MESSAGES["error"].format(error=str(e))
-            )
+            logger.error(f"{error_context}: {e}")
+            await update.message.reply_text(_err(str(e)))
     
     async def _start_download_monitoring(self, torrent_hash: str, chat_id: int):
         """Запустить мониторинг скачивания торрента"""
         # Получаем прогресс-бар для этого торрента
         progress_bar = progress_tracker.get_progress_bar(torrent_hash)
         
+        # Одно сообщение о ходе скачивания, которое затем редактируется
+        status_message = await self.application.bot.send_message(
+            chat_id=chat_id,
+            text="🚀 Начинаем мониторинг скачивания..."
+        )
+        
         # Создаем очередь для обновлений прогресса
         progress_queue = asyncio.Queue()
         
@@ -237,50 +487,56 @@ class TorrentBot:
                     # Создаем красивое сообщение с прогресс-баром
                     message = progress_bar.create_detailed_message(info)
                     
-                    # Добавляем обновление в очередь (без await)
-                    try:
-                        progress_queue.put_nowait({
-                            'message': message,
-                            'progress': progress
-                        })
-                    except asyncio.QueueFull:
-                        logger.warning("Очередь прогресса переполнена")
+                    # Колбэк вызывается из _await_completion в потоке цикла событий,
+                    # поэтому ставить в asyncio.Queue можно напрямую
+                    progress_queue.put_nowait({
+                        'message': message,
+                        'progress': progress
+                    })
                     
             except Exception as e:
                 logger.error(f"Ошибка в progress_callback: {e}")
         
-        # Запускаем задачи мониторинга и обработки прогресса
-        monitor_task = asyncio.create_task(
-            self._monitor_download(torrent_hash, chat_id, progress_callback)
-        )
+        # Обработка прогресса идёт отдельной задачей, мониторинг - в текущей
+        # (сам вызов уже выполняется в задаче из monitor_tasks)
         progress_task = asyncio.create_task(
-            self._process_progress_updates(progress_queue, chat_id, torrent_hash)
+            self._process_progress_updates(
+                progress_queue, chat_id, status_message.message_id, torrent_hash
+            )
         )
         
-        # Ждем завершения мониторинга и останавливаем обработку прогресса
-        await monitor_task
-        progress_task.cancel()
+        # Ждем завершения мониторинга и останавливаем обработку прогресса:
+        # обработчик спит в queue.get() и просыпается только от отмены
+        try:
+            await self._monitor_download(
+                torrent_hash, chat_id, status_message.message_id, progress_task, progress_callback
+            )
+        finally:
+            progress_task.cancel()
+            await asyncio.gather(progress_task, return_exceptions=True)
     
-    async def _process_progress_updates(self, progress_queue: asyncio.Queue, chat_id: int, torrent_hash: str):
+    async def _process_progress_updates(self, progress_queue: asyncio.Queue, chat_id: int,
+                                        message_id: int, torrent_hash: str):
         """Обрабатывать обновления прогресса из очереди"""
         try:
             while True:
-                try:
-                    # Ждем обновление из очереди с таймаутом
-                    update_data = await asyncio.wait_for(progress_queue.get(), timeout=1.0)
-                    
-                    # Отправляем обновление
-                    await self._send_progress_update(chat_id, update_data['message'])
-                    
-                    # Обновляем трекер
-                    progress_tracker.update_progress(torrent_hash, update_data['progress'])
-                    
-                    # Помечаем задачу как выполненную
+                # Ждем обновление из очереди (отмена задачи прерывает ожидание)
+                update_data = await progress_queue.get()
+                
+                # Пока шла отправка, могли накопиться новые обновления:
+                # устаревшие пропускаем и отправляем только самое свежее
+                while not progress_queue.empty():
                     progress_queue.task_done()
-                    
-                except asyncio.TimeoutError:
-                    # Таймаут - продолжаем ждать
-                    continue
+                    update_data = progress_queue.get_nowait()
+                
+                # Отправляем обновление
+                await self._send_progress_update(chat_id, message_id, update_data['message'])
+                
+                # Обновляем трекер
+                progress_tracker.update_progress(torrent_hash, update_data['progress'])
+                
+                # Помечаем задачу как выполненную
+                progress_queue.task_done()
                     
         except asyncio.CancelledError:
             # Задача отменена - завершаем
@@ -288,75 +544,66 @@ class TorrentBot:
         except Exception as e:
             logger.error(f"Ошибка обработки прогресса: {e}")
     
-    async def _send_progress_update(self, chat_id: int, message: str):
-        """Отправить обновление прогресса с обработкой ошибок"""
+    async def _send_progress_update(self, chat_id: int, message_id: int, message: str):
+        """Обновить сообщение о прогрессе с обработкой ошибок"""
         try:
-            # Используем Markdown для красивого форматирования
-            await self.application.bot.send_message(
+            # Редактируем одно сообщение вместо отправки новых: чат не засоряется,
+            # а лимиты Bot API расходуются экономнее
+            await self.application.bot.edit_message_text(
                 chat_id=chat_id,
+                message_id=message_id,
                 text=message,
-                parse_mode=ParseMode.MARKDOWN,
-                disable_notification=True  # Не беспокоим уведомлениями
+                parse_mode=ParseMode.MARKDOWN
             )
-        except Exception as e:
-            logger.warning(f"Не удалось отправить обновление прогресса: {e}")
-            # Пробуем отправить без форматирования
+        except BadRequest as e:
+            # Текст не изменился - обновлять нечего
+            if "not modified" in str(e).lower():
+                return
+            logger.warning(f"Не удалось обновить сообщение прогресса: {e}")
+            # Пробуем обновить без форматирования
             try:
                 plain_message = message.replace('**', '').replace('*', '')
-                await self.application.bot.send_message(
+                await self.application.bot.edit_message_text(
                     chat_id=chat_id,
-                    text=plain_message,
-                    disable_notification=True
+                    message_id=message_id,
+                    text=plain_message
                 )
             except Exception as e2:
-                logger.error(f"Не удалось отправить даже простое сообщение: {e2}")
+                logger.error(f"Не удалось обновить даже простое сообщение: {e2}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сообщение прогресса: {e}")
     
-    async def _monitor_download(self, torrent_hash: str, chat_id: int, progress_callback=None):
+    async def _monitor_download(self, torrent_hash: str, chat_id: int, message_id: int,
+                                progress_task: asyncio.Task, progress_callback=None):
         """Мониторинг скачивания торрента с прогресс-баром"""
         success = False
         try:
-            # Отправляем начальное сообщение
-            await self.application.bot.send_message(
-                chat_id=chat_id,
-                text="🚀 Начинаем мониторинг скачивания..."
-            )
-            
             # Ждём завершения скачивания с callback для прогресса
-            success = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                self.torrent_client.wait_for_completion, 
-                torrent_hash, 
-                progress_callback
-            )
+            success = await self._await_completion(torrent_hash, progress_callback)
+            
+            # Останавливаем обработку прогресса, чтобы запоздалое обновление
+            # не перезаписало итоговое сообщение
+            progress_task.cancel()
+            await asyncio.gather(progress_task, return_exceptions=True)
             
             if success:
-                # Получаем финальную информацию о торренте
-                info = self.torrent_client.get_torrent_info(torrent_hash)
+                # Итог скачивания выводим в том же сообщении прогресса, а не новыми сообщениями
+                info = await asyncio.to_thread(self.torrent_client.get_torrent_info, torrent_hash)
+                final_message = "🎉 **Скачивание завершено!**"
                 if info:
-                    # Создаем финальное сообщение с прогресс-баром
                     progress_bar = progress_tracker.get_progress_bar(torrent_hash)
-                    final_message = progress_bar.create_detailed_message(info)
-                    
-                    await self.application.bot.send_message(
-                        chat_id=chat_id,
-                        text=f"🎉 **Скачивание завершено!**\n\n{final_message}",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
+                    final_message += f"\n\n{progress_bar.create_detailed_message(info)}"
                 
                 # Автоматически отправляем файлы после завершения
-                await self.application.bot.send_message(
-                    chat_id=chat_id,
-                    text="📤 Подготавливаю файлы для отправки..."
+                await self._send_progress_update(
+                    chat_id, message_id, f"{final_message}\n\n📤 Подготавливаю файлы для отправки..."
                 )
                 
-                try:
-                    await self._send_completed_torrent_files(torrent_hash, chat_id)
-                except Exception as e:
-                    logger.error(f"Ошибка отправки файлов: {e}")
-                    await self.application.bot.send_message(
-                        chat_id=chat_id,
-                        text=f"❌ Ошибка отправки файлов: {str(e)}\n\nИспользуйте /status для ручной отправки."
-                    )
+                # Отправка идёт фоновой задачей: мониторинг завершается сразу,
+                # а данные прогресса освобождаются, не дожидаясь загрузки файлов
+                self._create_background_task(
+                    self._send_completed_files_task(torrent_hash, chat_id)
+                )
             else:
                 await self.application.bot.send_message(
                     chat_id=chat_id,
@@ -375,25 +622,108 @@ class TorrentBot:
             # Очищаем данные торрента из трекера
             progress_tracker.cleanup_torrent(torrent_hash)
     
-    def _escape_markdown(self, text: str) -> str:
-        """Экранировать специальные символы для Markdown"""
-        if not text:
-            return "Unknown"
+    async def _await_completion(self, torrent_hash: str, progress_callback=None) -> bool:
+        """Асинхронно ждать завершения скачивания торрента"""
+        logger.info(f"Ожидание завершения торрента {torrent_hash}")
         
-        # Символы, которые нужно экранировать в Markdown
-        escape_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+        while True:
+            # В потоке выполняется только сам запрос к qBittorrent, а не весь цикл ожидания
+            info = await asyncio.get_running_loop().run_in_executor(
+                self.monitor_pool, self.torrent_client.get_torrent_info, torrent_hash
+            )
+            
+            # Колбэк вызывается здесь, в потоке цикла событий (не в monitor_pool),
+            # поэтому может напрямую работать с asyncio.Queue
+            if info is not None and progress_callback:
+                try:
+                    progress_callback(info)
+                except Exception as callback_error:
+                    logger.warning(f"Ошибка callback функции: {callback_error}")
+            
+            result = self.torrent_client.check_completion(torrent_hash, info)
+            if result is not None:
+                return result
+            
+            await asyncio.sleep(POLL_INTERVAL)
+    
+    def _create_background_task(self, coro) -> asyncio.Task:
+        """Запустить фоновую задачу, сохранив ссылку на неё до завершения"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+    
+    def _create_monitor_task(self, torrent_hash: str, chat_id: int) -> asyncio.Task:
+        """Запустить мониторинг скачивания, сохранив ссылку на задачу до её завершения"""
+        task = asyncio.create_task(self._start_download_monitoring(torrent_hash, chat_id))
+        self.monitor_tasks.add(task)
+        task.add_done_callback(self._on_monitor_task_done)
+        return task
+    
+    def _on_monitor_task_done(self, task: asyncio.Task):
+        """Убрать завершённую задачу мониторинга и залогировать её ошибку"""
+        self.monitor_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка мониторинга скачивания: {task.exception()}")
+    
+    async def _start_cleanup_scheduler(self, application):
+        """Запустить планировщик очистки в цикле событий бота"""
+        self.cleanup_task = asyncio.create_task(
+            self.cleanup_manager.run_cleanup_scheduler(interval_hours=2)
+        )
+    
+    async def _wait_background_tasks(self, application):
+        """Остановить мониторинг скачиваний и дождаться фоновых задач перед остановкой бота"""
+        if self.cleanup_task is not None:
+            self.cleanup_task.cancel()
+            await asyncio.gather(self.cleanup_task, return_exceptions=True)
+        
+        if self.monitor_tasks:
+            logger.info(f"Остановка мониторинга скачиваний: {len(self.monitor_tasks)}")
+            monitor_tasks = list(self.monitor_tasks)
+            for task in monitor_tasks:
+                task.cancel()
+            await asyncio.gather(*monitor_tasks, return_exceptions=True)
         
-        escaped_text = text
-        for char in escape_chars:
-            escaped_text = escaped_text.replace(char, f'\\{char}')
+        if self.background_tasks:
+            logger.info(f"Ожидание фоновых задач: {len(self.background_tasks)}")
+            await asyncio.gather(*self.background_tasks, return_exceptions=True)
         
-        return escaped_text
+        # Сбрасываем логи операций здесь, а не только в atexit: обработчики atexit идут
+        # в обратном порядке, и к torrent_logger.close слушатель очереди логов уже остановлен
+        await asyncio.to_thread(torrent_logger.close)
+    
+    async def _send_completed_files_task(self, torrent_hash: str, chat_id: int):
+        """Фоновая отправка файлов завершенного торрента с уведомлением об ошибке"""
+        try:
+            await self._send_completed_torrent_files(torrent_hash, chat_id)
+        except Exception as e:
+            logger.error(f"Ошибка отправки файлов: {e}")
+            await self.application.bot.send_message(
+                chat_id=chat_id,
+                text=f"❌ Ошибка отправки файлов: {str(e)}\n\nИспользуйте /status для ручной отправки."
+            )
+    
+    def _escape_markdown(self, text: str) -> str:
+        """Экранировать специальные символы для Markdown"""
+        return _escape_markdown(text)
+    
+    async def _send_document(self, bot, chat_id: int, file_path: str, filename: str):
+        """Отправить файл документом, не блокируя цикл событий чтением с диска"""
+        # Через этот метод идут и части архива до SPLIT_CHUNK_SIZE (1.9 ГБ): целиком
+        # в потоке читаются только файлы до лимита Bot API, большие передаются открытым файлом
+        async with self.upload_semaphore, upload_payload(file_path) as document:
+            await bot.send_document(
+                chat_id=chat_id,
+                document=document,
+                filename=filename
+            )
     
     async def _send_completed_torrent_files(self, torrent_hash: str, chat_id: int):
         """Автоматически отправить файлы завершенного торрента"""
         try:
             # Получаем список файлов
-            files = self.torrent_client.get_torrent_files(torrent_hash)
+            files = await asyncio.to_thread(self.torrent_client.get_torrent_files, torrent_hash)
             
             if not files:
                 await self.application.bot.send_message(
@@ -403,7 +733,7 @@ class TorrentBot:
                 return
             
             # Получаем информацию о торренте
-            torrent_info = self.torrent_client.get_torrent_info(torrent_hash)
+            torrent_info = await asyncio.to_thread(self.torrent_client.get_torrent_info, torrent_hash)
             torrent_name = torrent_info.get('name', 'Unknown') if torrent_info else 'Unknown'
             
             # Экранируем имя торрента для безопасной отправки
@@ -415,12 +745,15 @@ class TorrentBot:
                 parse_mode=ParseMode.MARKDOWN
             )
             
+            # Размеры всех файлов собираем заранее, одним проходом по их директориям
+            file_sizes = await asyncio.to_thread(self.file_manager.get_file_sizes, files)
+            
             # Отправляем файлы
             sent_count = 0
             for i, file_path in enumerate(files, 1):
                 filename = os.path.basename(file_path)
                 try:
-                    file_size = self.file_manager.get_file_size(file_path)
+                    file_size = file_sizes[file_path]
                     
                     # Отправляем файл через SmartFileSender (автоматический выбор метода)
                     safe_filename = self._escape_markdown(filename)
@@ -445,7 +778,7 @@ class TorrentBot:
                             await self._split_and_send_file_auto(file_path, chat_id)
                     else:
                         # Fallback если SmartFileSender не инициализирован
-                        if file_size > 50 * 1024 * 1024:  # 50 МБ - лимит Bot API
+                        if file_size > BOT_API_FILE_LIMIT:
                             safe_filename_big = self._escape_markdown(filename)
                             await self.application.bot.send_message(
                                 chat_id=chat_id,
@@ -454,12 +787,9 @@ class TorrentBot:
                             )
                             await self._split_and_send_file_auto(file_path, chat_id)
                         else:
-                            with open(file_path, 'rb') as file:
-                                await self.application.bot.send_document(
-                                    chat_id=chat_id,
-                                    document=file,
-                                    filename=filename
-                                )
+                            await self._send_document(
+                                self.application.bot, chat_id, file_path, filename
+                            )
                     
                     sent_count += 1
                     
@@ -499,8 +829,11 @@ class TorrentBot:
             temp_dir = os.path.join(TEMP_DIR, f"split_auto_{chat_id}")
             os.makedirs(temp_dir, exist_ok=True)
             
-            # Разбиваем файл
-            parts = self.file_manager.split_file_7z(file_path, temp_dir)
+            # Разбиваем файл (сжатие 7z занимает минуты - выполняем в потоке). Все части
+            # создаются до первой отправки намеренно: 7z дописывает заголовок архива в .001
+            # в самом конце, так что выгружать тома по мере записи нельзя. Пиковый объём
+            # на диске - все части; каждая удаляется сразу после своей отправки
+            parts = await asyncio.to_thread(self.file_manager.split_file_7z, file_path, temp_dir)
             
             if not parts:
                 await self.application.bot.send_message(
@@ -510,26 +843,35 @@ class TorrentBot:
                 )
                 return
             
-            # Отправляем каждую часть
-            for i, part_path in enumerate(parts, 1):
-                part_filename = os.path.basename(part_path)
-                safe_part_filename = self._escape_markdown(part_filename)
-                
-                await self.application.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"📤 Отправляю часть {i}/{len(parts)}: {safe_part_filename}",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                
-                with open(part_path, 'rb') as part_file:
-                    await self.application.bot.send_document(
+            part_names = [os.path.basename(part_path) for part_path in parts]
+            
+            # Отправляем части параллельно, пока их суммарный размер укладывается в бюджет памяти
+            part_sizes = await asyncio.to_thread(self.file_manager.get_file_sizes, parts)
+            semaphore = asyncio.Semaphore(_part_upload_concurrency(max(part_sizes.values())))
+            
+            async def send_part(i: int, part_path: str, part_filename: str):
+                async with semaphore:
+                    safe_part_filename = self._escape_markdown(part_filename)
+                    
+                    await self.application.bot.send_message(
                         chat_id=chat_id,
-                        document=part_file,
-                        filename=part_filename
+                        text=f"📤 Отправляю часть {i}/{len(parts)}: {safe_part_filename}",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                    
+                    await self._send_document(
+                        self.application.bot, chat_id, part_path, part_filename
                     )
+                    # Отправленная часть больше не нужна - освобождаем место, не дожидаясь остальных
+                    await asyncio.to_thread(os.remove, part_path)
+            
+            await asyncio.gather(*(
+                send_part(i, part_path, part_filename)
+                for i, (part_path, part_filename) in enumerate(zip(parts, part_names), 1)
+            ))
             
             # Отправляем инструкции по сборке
-            first_part = os.path.basename(parts[0])
+            first_part = part_names[0]
             safe_first_part = self._escape_markdown(first_part)
             await self.application.bot.send_message(
                 chat_id=chat_id,
@@ -542,7 +884,7 @@ class TorrentBot:
             )
             
             # Очищаем временные файлы
-            self.file_manager.cleanup_directory(temp_dir)
+            await asyncio.to_thread(self.file_manager.cleanup_directory, temp_dir)
             
         except Exception as e:
             try:
@@ -565,96 +907,94 @@ class TorrentBot:
             await update.message.reply_text(MESSAGES["preparing_files"])
             
             # Получаем список файлов
-            files = self.torrent_client.get_torrent_files(torrent_hash)
+            files = await asyncio.to_thread(self.torrent_client.get_torrent_files, torrent_hash)
             
             if not files:
-                await update.message.reply_text(
-                    MESSAGES["error"].format(error="Не найдены скачанные файлы")
-                )
+                await update.message.reply_text(_ERR_NO_FILES)
                 return
             
-            # Обрабатываем каждый файл
+            # Размеры всех файлов собираем заранее, одним проходом по их директориям:
+            # после удаления торрента файлов на диске уже не будет
+            file_sizes = await asyncio.to_thread(self.file_manager.get_file_sizes, files)
+            total_size = sum(file_sizes.values())
+            
             for file_path in files:
-                await self._send_file(update, context, file_path, user_id)
+                await self._send_file(update, context, file_path, user_id, file_sizes[file_path])
             
             # Очищаем торрент
-            self.torrent_client.remove_torrent(torrent_hash, delete_files=True)
+            await asyncio.to_thread(self.torrent_client.remove_torrent, torrent_hash, delete_files=True)
             
             # Логируем завершение операции
-            if user_id in self.active_downloads:
-                download_info = self.active_downloads[user_id]
-                operation_id = download_info.get('operation_id')
-                if operation_id:
-                    total_size = sum(self.file_manager.get_file_size(f) for f in files)
-                    torrent_logger.log_download_completed(operation_id, total_size)
+            download = self.active_downloads.get(user_id)
+            if download and download.operation_id:
+                torrent_logger.log_download_completed(download.operation_id, total_size)
             
         except Exception as e:
             logger.error(f"Ошибка обработки файлов: {e}")
-            await update.message.reply_text(
-                MESSAGES["error"].format(error=str(e))
-            )
+            await update.message.reply_text(_err(str(e)))
     
     async def _send_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
-                        file_path: str, user_id: int):
-        """Отправить файл пользователю"""
+                        file_path: str, user_id: int, file_size: Optional[int] = None) -> int:
+        """Отправить файл пользователю, возвращает его размер"""
         try:
-            file_size = self.file_manager.get_file_size(file_path)
+            if file_size is None:
+                file_size = self.file_manager.get_file_size(file_path)
             filename = os.path.basename(file_path)
             
             # Проверяем место на диске
-            if not self.file_manager.check_disk_space(file_size * 2):  # *2 для архива
+            if not await asyncio.to_thread(self.file_manager.check_disk_space, file_size * 2):  # *2 для архива
                 await update.message.reply_text(MESSAGES["disk_full"])
-                return
+                return file_size
             
             # Если файл маленький, отправляем напрямую
-            if not self.file_manager.needs_splitting(file_path):
+            if not self.file_manager.needs_splitting(file_path, file_size):
                 await update.message.reply_text(
-                    MESSAGES["sending_file"].format(name=filename)
+                    render("sending_file", name=filename)
                 )
                 
                 # Логируем начало отправки
                 user_name = update.effective_user.first_name or "Unknown"
-                send_operation_id = torrent_logger.log_file_send_started(
+                send_operation_id = await asyncio.to_thread(
+                    torrent_logger.log_file_send_started,
                     user_id, user_name, filename, file_size
                 )
                 
-                with open(file_path, 'rb') as file:
-                    await context.bot.send_document(
-                        chat_id=update.effective_chat.id,
-                        document=file,
-                        filename=filename
-                    )
+                await self._send_document(
+                    context.bot, update.effective_chat.id, file_path, filename
+                )
                 
                 await update.message.reply_text(
-                    MESSAGES["file_sent"].format(name=filename)
+                    render("file_sent", name=filename)
                 )
                 
                 # Логируем завершение отправки
                 torrent_logger.log_file_send_completed(send_operation_id)
             else:
                 # Разбиваем большой файл
-                await self._split_and_send_file(update, context, file_path, user_id)
+                await self._split_and_send_file(update, context, file_path, user_id, file_size)
                 
         except Exception as e:
             logger.error(f"Ошибка отправки файла {file_path}: {e}")
-            await update.message.reply_text(
-                MESSAGES["error"].format(error=f"Ошибка отправки файла: {str(e)}")
-            )
+            await update.message.reply_text(_err(f"Ошибка отправки файла: {str(e)}"))
+        
+        return file_size or 0
     
     async def _split_and_send_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
-                                  file_path: str, user_id: int):
+                                  file_path: str, user_id: int, file_size: Optional[int] = None):
         """Разбить большой файл и отправить по частям"""
         try:
             filename = os.path.basename(file_path)
             
             await update.message.reply_text(
-                MESSAGES["splitting_file"].format(name=filename)
+                render("splitting_file", name=filename)
             )
             
             # Логируем начало разбивки
             user_name = update.effective_user.first_name or "Unknown"
-            file_size = self.file_manager.get_file_size(file_path)
-            split_operation_id = torrent_logger.log_file_split_started(
+            if file_size is None:
+                file_size = self.file_manager.get_file_size(file_path)
+            split_operation_id = await asyncio.to_thread(
+                torrent_logger.log_file_split_started,
                 user_id, user_name, filename, file_size
             )
             
@@ -662,293 +1002,280 @@ class TorrentBot:
             temp_dir = os.path.join(TEMP_DIR, f"split_{user_id}")
             os.makedirs(temp_dir, exist_ok=True)
             
-            # Разбиваем файл
-            parts = self.file_manager.split_file_7z(file_path, temp_dir)
+            # Разбиваем файл (сжатие 7z занимает минуты - выполняем в потоке). Все части
+            # создаются до первой отправки намеренно: 7z дописывает заголовок архива в .001
+            # в самом конце, так что выгружать тома по мере записи нельзя. Пиковый объём
+            # на диске - все части; каждая удаляется сразу после своей отправки
+            parts = await asyncio.to_thread(self.file_manager.split_file_7z, file_path, temp_dir)
             
             if not parts:
                 torrent_logger.log_error(split_operation_id, "Не удалось разбить файл")
-                await update.message.reply_text(
-                    MESSAGES["error"].format(error="Не удалось разбить файл")
-                )
+                await update.message.reply_text(_ERR_SPLIT_FAILED)
                 return
             
             # Логируем завершение разбивки
             torrent_logger.log_file_split_completed(split_operation_id, len(parts))
             
-            # Отправляем каждую часть
-            for i, part_path in enumerate(parts, 1):
-                part_filename = os.path.basename(part_path)
-                part_size = self.file_manager.get_file_size(part_path)
-                
-                await update.message.reply_text(
-                    f"📤 Отправляю часть {i}/{len(parts)}: {part_filename}"
-                )
-                
-                # Логируем отправку части
-                part_send_id = torrent_logger.log_file_send_started(
-                    user_id, user_name, part_filename, part_size
-                )
-                
-                with open(part_path, 'rb') as part_file:
-                    await context.bot.send_document(
-                        chat_id=update.effective_chat.id,
-                        document=part_file,
-                        filename=part_filename
+            part_names = [os.path.basename(part_path) for part_path in parts]
+            
+            # Отправляем части параллельно, пока их суммарный размер укладывается в бюджет памяти
+            part_sizes = await asyncio.to_thread(self.file_manager.get_file_sizes, parts)
+            semaphore = asyncio.Semaphore(_part_upload_concurrency(max(part_sizes.values())))
+            
+            async def send_part(i: int, part_path: str, part_filename: str):
+                async with semaphore:
+                    await update.message.reply_text(
+                        f"📤 Отправляю часть {i}/{len(parts)}: {part_filename}"
                     )
-                
-                # Логируем завершение отправки части
-                torrent_logger.log_file_send_completed(part_send_id)
+                    
+                    # Логируем отправку части
+                    part_send_id = await asyncio.to_thread(
+                        torrent_logger.log_file_send_started,
+                        user_id, user_name, part_filename, part_sizes[part_path]
+                    )
+                    
+                    await self._send_document(
+                        context.bot, update.effective_chat.id, part_path, part_filename
+                    )
+                    
+                    # Логируем завершение отправки части
+                    torrent_logger.log_file_send_completed(part_send_id)
+                    # Отправленная часть больше не нужна - освобождаем место, не дожидаясь остальных
+                    await asyncio.to_thread(os.remove, part_path)
+            
+            await asyncio.gather(*(
+                send_part(i, part_path, part_filename)
+                for i, (part_path, part_filename) in enumerate(zip(parts, part_names), 1)
+            ))
             
             # Отправляем инструкции по сборке
-            first_part = os.path.basename(parts[0])
+            first_part = part_names[0]
             await update.message.reply_text(
-                MESSAGES["split_instructions"].format(
+                render(
+                    "split_instructions",
                     parts=len(parts),
                     first_part=first_part
                 )
             )
             
             # Очищаем временные файлы
-            self.file_manager.cleanup_directory(temp_dir)
+            await asyncio.to_thread(self.file_manager.cleanup_directory, temp_dir)
             
         except Exception as e:
             logger.error(f"Ошибка разбивки файла {file_path}: {e}")
-            await update.message.reply_text(
-                MESSAGES["error"].format(error=f"Ошибка разбивки файла: {str(e)}")
-            )
+            await update.message.reply_text(_err(f"Ошибка разбивки файла: {str(e)}"))
     
+    @require_auth
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать статус всех торрентов с прогресс-барами"""
-        user_id = update.effective_user.id
-        
-        if not self.check_authorization(user_id):
-            await update.message.reply_text(MESSAGES["unauthorized"])
-            return
-        
         try:
-            if not self.torrent_client.is_connected():
-                await update.message.reply_text("❌ **Нет подключения к qBittorrent**", parse_mode=ParseMode.MARKDOWN)
+            # Запросы к qBittorrent блокирующие (requests), выполняем их вне цикла событий
+            if not await asyncio.to_thread(self.torrent_client.is_connected):
+                await update.message.reply_text("❌ <b>Нет подключения к qBittorrent</b>", parse_mode=ParseMode.HTML)
                 return
             
-            # Получаем все торренты
-            torrents = self.torrent_client.client.torrents_info()
+            # Получаем все торренты одним запросом к qBittorrent
+            torrents = await asyncio.to_thread(self.torrent_client.get_all_torrents_info)
             
             if not torrents:
-                await update.message.reply_text("📭 **Нет активных торрентов**", parse_mode=ParseMode.MARKDOWN)
+                await update.message.reply_text("📭 <b>Нет активных торрентов</b>", parse_mode=ParseMode.HTML)
                 return
             
-            # Группируем торренты по состояниям
-            downloading = []
-            completed = []
-            uploading = []
-            paused = []
-            errors = []
-            
-            for torrent in torrents:
-                info = self.torrent_client.get_torrent_info(torrent.hash)
-                if info:
-                    state = info['state']
-                    if state in ['downloading', 'stalledDL', 'queuedDL']:
-                        downloading.append(info)
-                    elif state in ['uploading', 'stalledUP', 'queuedUP']:
-                        if info['progress'] >= 100:
-                            completed.append(info)
-                        else:
-                            uploading.append(info)
-                    elif state in ['pausedDL', 'pausedUP']:
-                        paused.append(info)
-                    elif state in ['error', 'missingFiles']:
-                        errors.append(info)
+            # Группируем торренты по состояниям: один поиск в словаре на торрент
+            groups = {bucket: [] for bucket in ('downloading', 'completed', 'uploading', 'paused', 'errors')}
             
-            # Создаем сообщение со статистикой
-            messages = []
+            for info in torrents:
+                bucket = _STATUS_BUCKETS.get(info['state'])
+                if bucket is None:
+                    continue
+                if bucket == 'uploading' and info['progress'] >= 100:
+                    bucket = 'completed'
+                groups[bucket].append(info)
+            
+            downloading = groups['downloading']
+            completed = groups['completed']
+            uploading = groups['uploading']
+            paused = groups['paused']
+            errors = groups['errors']
+            
+            # Собираем сообщение сразу частями: длина текущей части считается по ходу,
+            # поэтому повторный проход для разбивки по лимиту Telegram не нужен
+            chunks = [[]]
+            chunk_length = 0
+            
+            # Строка торрента добавляется целиком, поэтому он не разрывается между частями
+            def add_line(line: str):
+                nonlocal chunk_length
+                line_length = _utf16_len(line) + 1  # +1 для \n
+                if chunk_length + line_length > STATUS_CHUNK_LIMIT and chunks[-1]:
+                    chunks.append([])
+                    chunk_length = 0
+                chunks[-1].append(line)
+                chunk_length += line_length
             
             if downloading:
-                messages.append("⬇️ **Скачиваются:**")
+                add_line(_STATUS_HDR_DOWNLOADING)
                 for info in downloading:
-                    progress_bar = progress_tracker.get_progress_bar(info['hash'])
-                    progress_line = progress_bar.create_bar(info['progress'])
-                    speed = progress_bar.format_speed(info['download_speed'])
-                    name = info['name'][:30] + ('...' if len(info['name']) > 30 else '')
-                    messages.append(f"`{progress_line}`")
-                    messages.append(f"📁 {name}")
-                    messages.append(f"⚡ {speed}")
-                    messages.append("")
+                    # Процент округляется до отображаемой точности: повторный /status берёт бар из кэша
+                    add_line(_STATUS_ROW_DOWNLOADING.format(
+                        bar=_status_bar(round(info['progress'], 1)),
+                        name=html.escape(_clip(info['name'], 30)),
+                        speed=ProgressBar.format_speed(info['download_speed']),
+                    ))
             
             if completed:
-                messages.append("✅ **Завершены:**")
+                add_line(_STATUS_HDR_COMPLETED)
                 for info in completed:
-                    name = info['name'][:40] + ('...' if len(info['name']) > 40 else '')
-                    size = progress_tracker.get_progress_bar('').format_size(info['size'])
-                    ratio = info.get('ratio', 0)
-                    messages.append(f"📁 {name}")
-                    messages.append(f"💾 {size} | 📤 Рейтинг: {ratio:.2f}")
-                    messages.append("")
+                    add_line(_STATUS_ROW_COMPLETED.format(
+                        name=html.escape(_clip(info['name'], 40)),
+                        size=ProgressBar.format_size(info['size']),
+                        ratio=info['ratio'],
+                    ))
             
             if uploading:
-                messages.append("⬆️ **Раздаются:**")
+                add_line(_STATUS_HDR_UPLOADING)
                 for info in uploading:
-                    name = info['name'][:40] + ('...' if len(info['name']) > 40 else '')
-                    up_speed = progress_tracker.get_progress_bar('').format_speed(info.get('upspeed', 0))
-                    messages.append(f"📁 {name}")
-                    messages.append(f"⚡ {up_speed}")
-                    messages.append("")
+                    add_line(_STATUS_ROW_UPLOADING.format(
+                        name=html.escape(_clip(info['name'], 40)),
+                        speed=ProgressBar.format_speed(info['upspeed']),
+                    ))
             
             if paused:
-                messages.append("⏸️ **Приостановлены:**")
+                add_line(_STATUS_HDR_PAUSED)
                 for info in paused:
-                    name = info['name'][:40] + ('...' if len(info['name']) > 40 else '')
-                    messages.append(f"📁 {name} ({info['progress']:.1f}%)")
+                    add_line(_STATUS_ROW_PAUSED.format(name=html.escape(_clip(info['name'], 40)), progress=info['progress']))
             
             if errors:
-                messages.append("❌ **Ошибки:**")
+                add_line(_STATUS_HDR_ERRORS)
                 for info in errors:
-                    name = info['name'][:40] + ('...' if len(info['name']) > 40 else '')
-                    messages.append(f"� {name}")
-            
-            # Отправляем сообщение частями, если оно слишком длинное
-            full_message = "\n".join(messages)
+                    add_line(_STATUS_ROW_ERRORS.format(name=html.escape(_clip(info['name'], 40))))
             
-            if len(full_message) > 4000:  # Лимит Telegram ~4096 символов
-                # Разбиваем на части
-                parts = []
-                current_part = []
-                current_length = 0
-                
-                for line in messages:
-                    line_length = len(line) + 1  # +1 для \n
-                    if current_length + line_length > 3500:  # Оставляем запас
-                        parts.append("\n".join(current_part))
-                        current_part = [line]
-                        current_length = line_length
-                    else:
-                        current_part.append(line)
-                        current_length += line_length
-                
-                if current_part:
-                    parts.append("\n".join(current_part))
-                
-                # Отправляем части
-                for i, part in enumerate(parts):
-                    header = f"📊 **Статус торрентов** (часть {i+1}/{len(parts)})\n\n" if len(parts) > 1 else "📊 **Статус торрентов**\n\n"
-                    await update.message.reply_text(header + part, parse_mode=ParseMode.MARKDOWN)
+            # Отправляем сообщение (частями, если оно не помещается в одно)
+            if len(chunks) == 1:
+                await update.message.reply_text(
+                    _STATUS_HEADER + "\n".join(chunks[0]), parse_mode=ParseMode.HTML
+                )
             else:
-                await update.message.reply_text(f"📊 **Статус торрентов**\n\n{full_message}", parse_mode=ParseMode.MARKDOWN)
+                total = len(chunks)
+                for i, chunk in enumerate(chunks, 1):
+                    header = f"📊 <b>Статус торрентов</b> (часть {i}/{total})\n\n"
+                    await update.message.reply_text(header + "\n".join(chunk), parse_mode=ParseMode.HTML)
         
         except Exception as e:
             logger.error(f"Ошибка получения статуса: {e}")
-            await update.message.reply_text(f"❌ **Ошибка получения статуса**\n\n`{str(e)}`", parse_mode=ParseMode.MARKDOWN)
+            await update.message.reply_text(
+                f"❌ <b>Ошибка получения статуса</b>\n\n<code>{html.escape(str(e))}</code>", parse_mode=ParseMode.HTML
+            )
     
+    @require_auth
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для получения статистики бота (только для авторизованных пользователей)"""
-        user_id = update.effective_user.id
-        
-        if not self.check_authorization(user_id):
-            await update.message.reply_text(MESSAGES["unauthorized"])
-            return
-        
         try:
-            # Получаем статистику операций
-            stats = torrent_logger.get_operation_stats(days=7)
-            
-            # Получаем статистику диска
-            disk_stats = self.cleanup_manager.get_disk_usage_stats()
+            # Повторные /stats в течение STATS_CACHE_TTL не пересчитывают статистику
+            if self.stats_cache and time.monotonic() - self.stats_cache[0] < STATS_CACHE_TTL:
+                _, stats, disk_stats = self.stats_cache
+            else:
+                # Статистику операций (SQLite) и диска собираем параллельно вне цикла событий
+                stats, disk_stats = await asyncio.gather(
+                    asyncio.to_thread(torrent_logger.get_operation_stats, days=7),
+                    asyncio.to_thread(self.cleanup_manager.get_disk_usage_stats)
+                )
+                self.stats_cache = (time.monotonic(), stats, disk_stats)
             
-            stats_text = "📊 **Статистика бота (7 дней):**\n\n"
+            # Собираем текст списком и склеиваем один раз
+            parts = ["📊 **Статистика бота (7 дней):**\n\n"]
             
             # Операции
             total_ops = stats.get('total_operations', 0)
-            stats_text += f"🔄 Всего операций: {total_ops}\n"
+            parts.append(f"🔄 Всего операций: {total_ops}\n")
             
             if stats.get('operations_by_type'):
-                stats_text += "\n📈 По типам:\n"
-                for op_type, count in stats['operations_by_type'].items():
-                    stats_text += f"  • {op_type}: {count}\n"
+                parts.append("\n📈 По типам:\n")
+                parts.extend(f"  • {op_type}: {count}\n"
+                             for op_type, count in stats['operations_by_type'].items())
             
             if stats.get('operations_by_status'):
-                stats_text += "\n📋 По статусам:\n"
-                for status, count in stats['operations_by_status'].items():
-                    stats_text += f"  • {status}: {count}\n"
+                parts.append("\n📋 По статусам:\n")
+                parts.extend(f"  • {status}: {count}\n"
+                             for status, count in stats['operations_by_status'].items())
             
             # Передано данных
             total_bytes = stats.get('total_transferred_bytes', 0)
             if total_bytes > 0:
                 total_gb = total_bytes / (1024**3)
-                stats_text += f"\n💾 Передано: {total_gb:.2f} ГБ\n"
+                parts.append(f"\n💾 Передано: {total_gb:.2f} ГБ\n")
             
             # Использование диска
-            stats_text += f"\n💿 **Диск:**\n"
-            stats_text += f"Использовано: {self.cleanup_manager.format_size(disk_stats.get('total_size', 0))}\n"
-            stats_text += f"Лимит: {self.cleanup_manager.format_size(disk_stats.get('max_size', 0))}\n"
-            stats_text += f"Процент: {disk_stats.get('usage_percent', 0):.1f}%"
+            parts.append("\n💿 **Диск:**\n")
+            parts.append(f"Использовано: {self.cleanup_manager.format_size(disk_stats.get('total_size', 0))}\n")
+            parts.append(f"Лимит: {self.cleanup_manager.format_size(disk_stats.get('max_size', 0))}\n")
+            parts.append(f"Процент: {disk_stats.get('usage_percent', 0):.1f}%")
+            
+            stats_text = "".join(parts)
             
             await update.message.reply_text(stats_text, parse_mode=ParseMode.MARKDOWN)
             
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
-            await update.message.reply_text(
-                MESSAGES["error"].format(error="Не удалось получить статистику")
-            )
+            await update.message.reply_text(_ERR_STATS_FAILED)
     
+    @require_auth
     async def cleanup_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для принудительной очистки (только для авторизованных пользователей)"""
         user_id = update.effective_user.id
         
-        if not self.check_authorization(user_id):
-            await update.message.reply_text(MESSAGES["unauthorized"])
-            return
-        
         try:
             await update.message.reply_text("🗑️ Запуск очистки...")
             
-            # Принудительная очистка
-            self.cleanup_manager.force_cleanup()
+            # Принудительная очистка (обход диска выполняется вне цикла событий,
+            # одновременно с плановой очисткой не запускается)
+            await self.cleanup_manager.force_cleanup_async()
+            self.stats_cache = None
             
             # Очистка старых логов
-            torrent_logger.cleanup_old_logs(days=30)
+            await asyncio.to_thread(torrent_logger.cleanup_old_logs, days_to_keep=30)
             
             # Получаем новую статистику диска
-            disk_stats = self.cleanup_manager.get_disk_usage_stats()
+            disk_stats = await asyncio.to_thread(self.cleanup_manager.get_disk_usage_stats)
             
-            result_text = f"✅ Очистка завершена!\n\n"
-            result_text += f"💿 Использование диска:\n"
-            result_text += f"Использовано: {self.cleanup_manager.format_size(disk_stats.get('total_size', 0))}\n"
-            result_text += f"Процент: {disk_stats.get('usage_percent', 0):.1f}%"
+            result_text = (
+                "✅ Очистка завершена!\n\n"
+                "💿 Использование диска:\n"
+                f"Использовано: {self.cleanup_manager.format_size(disk_stats.get('total_size', 0))}\n"
+                f"Процент: {disk_stats.get('usage_percent', 0):.1f}%"
+            )
             
             await update.message.reply_text(result_text)
             
         except Exception as e:
             logger.error(f"Ошибка очистки: {e}")
-            await update.message.reply_text(
-                MESSAGES["error"].format(error="Ошибка при очистке")
-            )
+            await update.message.reply_text(_ERR_CLEANUP_FAILED)
     
+    @admin_only("❌ Только администраторы могут добавлять пользователей.")
+    @requires_args(
+        "📝 Использование: /adduser <user_id> [role]\n"
+        "Роли: user (по умолчанию), admin\n"
+        "Пример: /adduser 123456789 user"
+    )
     async def add_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для добавления пользователя (только для админов)"""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
-        if not user_manager.is_admin(user_id):
-            await update.message.reply_text("❌ Только администраторы могут добавлять пользователей.")
-            return
-        
-        if not context.args:
-            await update.message.reply_text(
-                "📝 Использование: /adduser <user_id> [role]\n"
-                "Роли: user (по умолчанию), admin\n"
-                "Пример: /adduser 123456789 user"
-            )
+        target_user_id = _parse_user_id(context.args[0])
+        if target_user_id is None:
+            await reply(_INVALID_USER_ID_MSG)
             return
         
         try:
-            target_user_id = int(context.args[0])
             role = context.args[1] if len(context.args) > 1 else 'user'
             
             if role not in ['user', 'admin']:
-                await update.message.reply_text("❌ Неверная роль. Используйте: user или admin")
+                await reply("❌ Неверная роль. Используйте: user или admin")
                 return
             
             if user_manager.user_exists(target_user_id):
-                await update.message.reply_text(f"❌ Пользователь {target_user_id} уже существует.")
+                await reply(f"❌ Пользователь {target_user_id} уже существует.")
                 return
             
             success = user_manager.add_user(
@@ -959,219 +1286,205 @@ class TorrentBot:
             
             if success:
                 role_emoji = "👑" if role == "admin" else "👤"
-                await update.message.reply_text(
+                await reply(
                     f"✅ Пользователь {target_user_id} добавлен с ролью {role_emoji} {role}"
                 )
             else:
-                await update.message.reply_text("❌ Ошибка при добавлении пользователя.")
+                await reply("❌ Ошибка при добавлении пользователя.")
                 
-        except ValueError:
-            await update.message.reply_text("❌ Неверный ID пользователя. Используйте числовой ID.")
         except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+            await reply(f"❌ Ошибка: {str(e)}")
     
+    @admin_only("❌ Только администраторы могут удалять пользователей.")
+    @requires_args(
+        "📝 Использование: /removeuser <user_id>\n"
+        "Пример: /removeuser 123456789"
+    )
     async def remove_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для удаления пользователя (только для админов)"""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
-        if not user_manager.is_admin(user_id):
-            await update.message.reply_text("❌ Только администраторы могут удалять пользователей.")
-            return
-        
-        if not context.args:
-            await update.message.reply_text(
-                "📝 Использование: /removeuser <user_id>\n"
-                "Пример: /removeuser 123456789"
-            )
+        target_user_id = _parse_user_id(context.args[0])
+        if target_user_id is None:
+            await reply(_INVALID_USER_ID_MSG)
             return
         
         try:
-            target_user_id = int(context.args[0])
-            
             if target_user_id == user_id:
-                await update.message.reply_text("❌ Вы не можете удалить самого себя.")
+                await reply("❌ Вы не можете удалить самого себя.")
                 return
             
             if not user_manager.user_exists(target_user_id):
-                await update.message.reply_text(f"❌ Пользователь {target_user_id} не найден.")
+                await reply(f"❌ Пользователь {target_user_id} не найден.")
                 return
             
             success = user_manager.remove_user(target_user_id, removed_by=user_id)
             
             if success:
-                await update.message.reply_text(f"✅ Пользователь {target_user_id} удален.")
+                await reply(f"✅ Пользователь {target_user_id} удален.")
             else:
-                await update.message.reply_text("❌ Ошибка при удалении пользователя (возможно, это последний админ).")
+                await reply("❌ Ошибка при удалении пользователя (возможно, это последний админ).")
                 
-        except ValueError:
-            await update.message.reply_text("❌ Неверный ID пользователя. Используйте числовой ID.")
         except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+            await reply(f"❌ Ошибка: {str(e)}")
     
+    @admin_only("❌ Только администраторы могут просматривать список пользователей.")
     async def list_users_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для просмотра списка пользователей (только для админов)"""
-        user_id = update.effective_user.id
-        
-        if not user_manager.is_admin(user_id):
-            await update.message.reply_text("❌ Только администраторы могут просматривать список пользователей.")
-            return
+        reply = update.message.reply_text
         
         try:
-            users = user_manager.get_all_users()
-            stats = user_manager.get_user_stats()
+            # Один запрос к БД: всего пользователей - это длина того же списка активных
+            users = await asyncio.to_thread(user_manager.get_all_users)
             
             if not users:
-                await update.message.reply_text("📭 Нет зарегистрированных пользователей.")
+                await reply("📭 Нет зарегистрированных пользователей.")
                 return
             
-            message = f"👥 **Пользователи бота** (всего: {stats['total']})\n\n"
+            # Собираем текст списком и склеиваем один раз
+            parts = [f"👥 **Пользователи бота** (всего: {len(users)})\n\n"]
             
-            # Группируем по ролям
-            admins = [u for u in users if u['role'] == 'admin']
-            regular_users = [u for u in users if u['role'] == 'user']
+            # Группируем по ролям за один проход (пользователи с другими ролями не выводятся)
+            by_role = {'admin': [], 'user': []}
+            for user in users:
+                group = by_role.get(user['role'])
+                if group is not None:
+                    group.append(user)
+            admins = by_role['admin']
+            regular_users = by_role['user']
             
             if admins:
-                message += "👑 **Администраторы:**\n"
-                for user in admins:
-                    name = user['first_name'] or "Неизвестно"
-                    username = f"@{user['username']}" if user['username'] else ""
-                    message += f"• {user['user_id']} - {name} {username}\n"
-                message += "\n"
+                parts.append("👑 **Администраторы:**\n")
+                parts.append("".join(map(_render_user, admins)))
+                parts.append("\n")
             
             if regular_users:
-                message += "👤 **Пользователи:**\n"
-                for user in regular_users:
-                    name = user['first_name'] or "Неизвестно"
-                    username = f"@{user['username']}" if user['username'] else ""
-                    message += f"• {user['user_id']} - {name} {username}\n"
+                parts.append("👤 **Пользователи:**\n")
+                parts.append("".join(map(_render_user, regular_users)))
             
-            await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+            await reply("".join(parts), parse_mode=ParseMode.MARKDOWN)
             
         except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка получения списка пользователей: {str(e)}")
+            await reply(f"❌ Ошибка получения списка пользователей: {str(e)}")
     
+    @admin_only("❌ Только администраторы могут повышать пользователей.")
+    @requires_args(
+        "📝 Использование: /promote <user_id>\n"
+        "Пример: /promote 123456789"
+    )
     async def promote_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для повышения пользователя до админа (только для админов)"""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
-        if not user_manager.is_admin(user_id):
-            await update.message.reply_text("❌ Только администраторы могут повышать пользователей.")
-            return
-        
-        if not context.args:
-            await update.message.reply_text(
-                "📝 Использование: /promote <user_id>\n"
-                "Пример: /promote 123456789"
-            )
+        target_user_id = _parse_user_id(context.args[0])
+        if target_user_id is None:
+            await reply(_INVALID_USER_ID_MSG)
             return
         
         try:
-            target_user_id = int(context.args[0])
-            
-            if not user_manager.user_exists(target_user_id):
-                await update.message.reply_text(f"❌ Пользователь {target_user_id} не найден.")
+            # Существование и роль - одним запросом
+            target_role = user_manager.get_role(target_user_id)
+            if target_role is None:
+                await reply(f"❌ Пользователь {target_user_id} не найден.")
                 return
             
-            if user_manager.is_admin(target_user_id):
-                await update.message.reply_text(f"❌ Пользователь {target_user_id} уже является администратором.")
+            if target_role == 'admin':
+                await reply(f"❌ Пользователь {target_user_id} уже является администратором.")
                 return
             
             success = user_manager.promote_to_admin(target_user_id, promoted_by=user_id)
             
             if success:
-                await update.message.reply_text(f"✅ Пользователь {target_user_id} повышен до администратора.")
+                await reply(f"✅ Пользователь {target_user_id} повышен до администратора.")
             else:
-                await update.message.reply_text("❌ Ошибка при повышении пользователя.")
+                await reply("❌ Ошибка при повышении пользователя.")
                 
-        except ValueError:
-            await update.message.reply_text("❌ Неверный ID пользователя. Используйте числовой ID.")
         except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+            await reply(f"❌ Ошибка: {str(e)}")
     
+    @admin_only("❌ Только администраторы могут понижать других админов.")
+    @requires_args(
+        "📝 Использование: /demote <user_id>\n"
+        "Пример: /demote 123456789"
+    )
     async def demote_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для понижения админа до пользователя (только для админов)"""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
-        if not user_manager.is_admin(user_id):
-            await update.message.reply_text("❌ Только администраторы могут понижать других админов.")
-            return
-        
-        if not context.args:
-            await update.message.reply_text(
-                "📝 Использование: /demote <user_id>\n"
-                "Пример: /demote 123456789"
-            )
+        target_user_id = _parse_user_id(context.args[0])
+        if target_user_id is None:
+            await reply(_INVALID_USER_ID_MSG)
             return
         
         try:
-            target_user_id = int(context.args[0])
-            
             if target_user_id == user_id:
-                await update.message.reply_text("❌ Вы не можете понизить самого себя.")
+                await reply("❌ Вы не можете понизить самого себя.")
                 return
             
-            if not user_manager.user_exists(target_user_id):
-                await update.message.reply_text(f"❌ Пользователь {target_user_id} не найден.")
+            # Существование и роль - одним запросом
+            target_role = user_manager.get_role(target_user_id)
+            if target_role is None:
+                await reply(f"❌ Пользователь {target_user_id} не найден.")
                 return
             
-            if not user_manager.is_admin(target_user_id):
-                await update.message.reply_text(f"❌ Пользователь {target_user_id} не является администратором.")
+            if target_role != 'admin':
+                await reply(f"❌ Пользователь {target_user_id} не является администратором.")
                 return
             
             success = user_manager.demote_from_admin(target_user_id, demoted_by=user_id)
             
             if success:
-                await update.message.reply_text(f"✅ Пользователь {target_user_id} понижен до обычного пользователя.")
+                await reply(f"✅ Пользователь {target_user_id} понижен до обычного пользователя.")
             else:
-                await update.message.reply_text("❌ Ошибка при понижении (возможно, это последний админ).")
+                await reply("❌ Ошибка при понижении (возможно, это последний админ).")
                 
-        except ValueError:
-            await update.message.reply_text("❌ Неверный ID пользователя. Используйте числовой ID.")
         except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+            await reply(f"❌ Ошибка: {str(e)}")
     
+    @require_auth
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда помощи"""
-        user_id = update.effective_user.id
-        
-        if not self.check_authorization(user_id):
-            await update.message.reply_text(MESSAGES["unauthorized"])
-            return
-        
-        help_text = "🤖 **Команды бота:**\n\n"
-        help_text += "📥 **Основные команды:**\n"
-        help_text += "/start - Начать работу с ботом\n"
-        help_text += "/status - Статус активных загрузок\n"
-        help_text += "/stats - Статистика бота\n"
-        help_text += "/cleanup - Очистка временных файлов\n"
-        help_text += "/help - Показать эту справку\n\n"
-        
-        if user_manager.is_admin(user_id):
-            help_text += "👑 **Команды администратора:**\n"
-            help_text += "/adduser <id> [role] - Добавить пользователя\n"
-            help_text += "/removeuser <id> - Удалить пользователя\n"
-            help_text += "/listusers - Список пользователей\n"
-            help_text += "/promote <id> - Повысить до админа\n"
-            help_text += "/demote <id> - Понизить до пользователя\n\n"
-        
-        help_text += "📁 **Использование:**\n"
-        help_text += "• Отправьте .torrent файл\n"
-        help_text += "• Отправьте magnet-ссылку\n\n"
-        help_text += "Файлы > 2 ГБ будут автоматически разбиты на части."
-        
+        help_text = _HELP_ADMIN if self._is_admin(update, context) else _HELP_USER
         await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
     
     def run(self):
         """Запустить бота"""
-        if not BOT_TOKEN:
+        try:
+            bot_token = get_bot_token()
+        except RuntimeError:
             logger.error("BOT_TOKEN не установлен!")
             return
         
         if not AUTHORIZED_USERS:
             logger.warning("AUTHORIZED_USERS пуст - никто не сможет использовать бота!")
         
-        # Создаём приложение
-        app = ApplicationBuilder().token(BOT_TOKEN).build()
+        # uvloop - более быстрый цикл событий; на Windows недоступен, тогда остаётся стандартный
+        try:
+            import uvloop
+            uvloop.install()
+            logger.info("Используется цикл событий uvloop")
+        except ImportError:
+            pass
+        
+        # Создаём приложение: обновления обрабатываются параллельно (мониторинг скачивания
+        # не блокирует остальные команды), а пул соединений рассчитан на одновременные
+        # сообщения прогресса и загрузки частей файлов. AIORateLimiter удерживает все
+        # запросы в лимитах Telegram (30 сообщений/с, 20 в минуту на группу) и повторяет их после 429
+        app = (
+            ApplicationBuilder()
+            .token(bot_token)
+            .concurrent_updates(True)
+            .connection_pool_size(64)
+            .pool_timeout(30)
+            .get_updates_pool_timeout(30)
+            .rate_limiter(AIORateLimiter(max_retries=3))
+            .post_init(self._start_cleanup_scheduler)
+            .post_stop(self._wait_background_tasks)
+            .build()
+        )
         
         # Устанавливаем application в TorrentBot для отправки сообщений
         self.application = app
@@ -1180,38 +1493,39 @@ class TorrentBot:
         self.smart_file_sender = SmartFileSender(app.bot, self.file_manager)
         
         # Добавляем обработчики
-        app.add_handler(CommandHandler("start", self.start_command))
-        app.add_handler(CommandHandler("status", self.status_command))
-        app.add_handler(CommandHandler("stats", self.stats_command))
-        app.add_handler(CommandHandler("cleanup", self.cleanup_command))
-        app.add_handler(CommandHandler("help", self.help_command))
-        
-        # Команды управления пользователями (только для админов)
-        app.add_handler(CommandHandler("adduser", self.add_user_command))
-        app.add_handler(CommandHandler("removeuser", self.remove_user_command))
-        app.add_handler(CommandHandler("listusers", self.list_users_command))
-        app.add_handler(CommandHandler("promote", self.promote_user_command))
-        app.add_handler(CommandHandler("demote", self.demote_user_command))
-        
-        app.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text))
+        commands = (
+            ("start", self.start_command),
+            ("status", self.status_command),
+            ("stats", self.stats_command),
+            ("cleanup", self.cleanup_command),
+            ("help", self.help_command),
+            
+            # Команды управления пользователями (только для админов)
+            ("adduser", self.add_user_command),
+            ("removeuser", self.remove_user_command),
+            ("listusers", self.list_users_command),
+            ("promote", self.promote_user_command),
+            ("demote", self.demote_user_command),
+        )
+        app.add_handlers([CommandHandler(name, callback) for name, callback in commands])
+        app.add_handlers([
+            MessageHandler(filters.Document.ALL, self.handle_document),
+            MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text),
+        ])
         
         logger.info("Бот запущен")
         print("🤖 Telegram-бот торрентов запущен!")
         print("📝 Для работы бота необходимо:")
         print("1. Установить BOT_TOKEN в переменной окружения")
-        print("2. Добавить свой Telegram ID в AUTHORIZED_USERS в config.py")
+        print("2. Добавить свой Telegram ID в AUTHORIZED_USERS_ORDERED в config.py")
         print("3. Настроить и запустить qBittorrent с Web UI")
         
         # Запускаем бота
         app.run_polling()
+        self.monitor_pool.shutdown(wait=False)
 
 
 if __name__ == "__main__":
-    # Создаём необходимые директории
-    for directory in [TEMP_DIR, LOGS_DIR]:
-        os.makedirs(directory, exist_ok=True)
-    
     # Запускаем бота
     bot = TorrentBot()
     bot.run()
\ No newline at end of file
@@ -3,69 +3,81 @@
 """
 import os
 import time
+import heapq
+import asyncio
 import logging
-import threading
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-from config import TEMP_DIR, DOWNLOADS_DIR, MAX_DISK_USAGE
+from config import TEMP_DIR_STR, DOWNLOADS_DIR_STR, MAX_DISK_USAGE
+from src.util import format_size
 
 logger = logging.getLogger(__name__)
 
 
+def _iter_files(directory: str) -> Iterator[os.DirEntry]:
+    """Рекурсивно обойти директорию через os.scandir, выдавая только файлы"""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield from _iter_files(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+                except OSError:
+                    pass
+    except OSError as e:
+        logger.warning(f"Не удалось прочитать директорию {directory}: {e}")
+
+
 class CleanupManager:
     """Менеджер для автоматической очистки временных файлов"""
     
     def __init__(self):
-        self.temp_dir = TEMP_DIR
-        self.downloads_dir = DOWNLOADS_DIR
+        self.temp_dir = TEMP_DIR_STR
+        self.downloads_dir = DOWNLOADS_DIR_STR
         self.max_disk_usage = MAX_DISK_USAGE
-        self.cleanup_thread = None
-        self.running = False
-        
-    def start_cleanup_scheduler(self, interval_hours: int = 2):
-        """Запустить планировщик очистки"""
-        if self.cleanup_thread and self.cleanup_thread.is_alive():
-            logger.warning("Планировщик очистки уже запущен")
-            return
-        
-        self.running = True
-        self.cleanup_thread = threading.Thread(
-            target=self._cleanup_loop,
-            args=(interval_hours,),
-            daemon=True
-        )
-        self.cleanup_thread.start()
-        logger.info(f"Планировщик очистки запущен (интервал: {interval_hours}ч)")
+        self._async_lock = None  # asyncio.Lock, создаётся в цикле событий бота
     
-    def stop_cleanup_scheduler(self):
-        """Остановить планировщик очистки"""
-        self.running = False
-        if self.cleanup_thread:
-            self.cleanup_thread.join(timeout=5)
-        logger.info("Планировщик очистки остановлен")
+    def _get_async_lock(self) -> asyncio.Lock:
+        """Блокировка, не дающая плановой и ручной очистке выполняться одновременно"""
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
     
-    def _cleanup_loop(self, interval_hours: int):
-        """Основной цикл очистки"""
+    async def run_cleanup_scheduler(self, interval_hours: int = 2):
+        """
+        Планировщик очистки: запускается задачей в цикле событий бота и
+        останавливается её отменой. Обход и удаление файлов выполняются в потоке.
+        """
         interval_seconds = interval_hours * 3600
+        logger.info(f"Планировщик очистки запущен (интервал: {interval_hours}ч)")
         
-        while self.running:
-            try:
-                self.cleanup_old_files()
-                self.check_disk_usage()
+        try:
+            while True:
+                try:
+                    async with self._get_async_lock():
+                        await asyncio.to_thread(self.cleanup_old_files)
+                        await asyncio.to_thread(self.check_disk_usage)
+                except Exception as e:
+                    logger.error(f"Ошибка в цикле очистки: {e}")
+                    await asyncio.sleep(60)  # Ждём минуту при ошибке
+                    continue
                 
-                # Ждём до следующей очистки
-                for _ in range(interval_seconds):
-                    if not self.running:
-                        break
-                    time.sleep(1)
-                    
-            except Exception as e:
-                logger.error(f"Ошибка в цикле очистки: {e}")
-                time.sleep(60)  # Ждём минуту при ошибке
+                await asyncio.sleep(interval_seconds)
+        finally:
+            logger.info("Планировщик очистки остановлен")
+    
+    async def force_cleanup_async(self, total_usage: Optional[int] = None):
+        """Асинхронная обёртка force_cleanup для цикла событий бота"""
+        async with self._get_async_lock():
+            await asyncio.to_thread(self.force_cleanup, total_usage)
     
-    def cleanup_old_files(self, max_age_hours: int = 24):
-        """Очистить старые файлы"""
+    def cleanup_old_files(self, max_age_hours: int = 24) -> int:
+        """Очистить старые файлы, вернуть освобождённое место в байтах"""
+        freed_space = 0
         try:
             current_time = time.time()
             max_age_seconds = max_age_hours * 3600
@@ -74,29 +86,9 @@ class CleanupManager:
             
             # Очищаем временные файлы
             if os.path.exists(self.temp_dir):
-                for root, dirs, files in os.walk(self.temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        try:
-                            file_age = current_time - os.path.getmtime(file_path)
-                            if file_age > max_age_seconds:
-                                file_size = os.path.getsize(file_path)
-                                os.remove(file_path)
-                                cleaned_files += 1
-                                freed_space += file_size
-                                logger.debug(f"Удалён старый файл: {file_path}")
-                        except (OSError, IOError) as e:
-                            logger.warning(f"Не удалось удалить файл {file_path}: {e}")
-                    
-                    # Удаляем пустые директории
-                    for dir_name in dirs:
-                        dir_path = os.path.join(root, dir_name)
-                        try:
-                            if not os.listdir(dir_path):  # Если директория пустая
-                                os.rmdir(dir_path)
-                                logger.debug(f"Удалена пустая директория: {dir_path}")
-                        except (OSError, IOError):
-                            pass
+                cleaned_files, freed_space = self._cleanup_old_in_directory(
+                    self.temp_dir, current_time - max_age_seconds
+                )
             
             if cleaned_files > 0:
                 freed_mb = freed_space / (1024 * 1024)
@@ -105,6 +97,51 @@ class CleanupManager:
             
         except Exception as e:
             logger.error(f"Ошибка очистки старых файлов: {e}")
+        
+        return freed_space
+    
+    def _cleanup_old_in_directory(self, directory: str, cutoff: float) -> Tuple[int, int]:
+        """
+        Удалить файлы старше cutoff и пустые поддиректории, не менявшиеся с cutoff
+        
+        Returns:
+            (количество удалённых файлов, освобождённое место в байтах)
+        """
+        cleaned_files = 0
+        freed_space = 0
+        
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            files, space = self._cleanup_old_in_directory(entry.path, cutoff)
+                            cleaned_files += files
+                            freed_space += space
+                            
+                            # Удаляем директорию, если она опустела и сама старше cutoff:
+                            # только что созданная (split_* перед записью частей) пуста недолго
+                            # и должна остаться. После удаления файлов её mtime обновится,
+                            # поэтому она будет удалена при следующей очистке
+                            try:
+                                if os.stat(entry.path, follow_symlinks=False).st_mtime < cutoff:
+                                    os.rmdir(entry.path)
+                                    logger.debug(f"Удалена пустая директория: {entry.path}")
+                            except OSError:
+                                pass
+                        else:
+                            stat = entry.stat(follow_symlinks=False)
+                            if stat.st_mtime < cutoff:
+                                os.remove(entry.path)
+                                cleaned_files += 1
+                                freed_space += stat.st_size
+                                logger.debug(f"Удалён старый файл: {entry.path}")
+                    except (OSError, IOError) as e:
+                        logger.warning(f"Не удалось удалить файл {entry.path}: {e}")
+        except (OSError, IOError) as e:
+            logger.warning(f"Не удалось прочитать директорию {directory}: {e}")
+        
+        return cleaned_files, freed_space
     
     def check_disk_usage(self):
         """Проверить использование дискового пространства"""
@@ -116,52 +153,84 @@ class CleanupManager:
                               f"{total_usage / (1024**3):.1f} ГБ из "
                               f"{self.max_disk_usage / (1024**3):.1f} ГБ")
                 
-                # Принудительная очистка
-                self.force_cleanup()
+                # Принудительная очистка (размер уже посчитан - повторно не обходим диск)
+                self.force_cleanup(total_usage)
             
         except Exception as e:
             logger.error(f"Ошибка проверки дискового пространства: {e}")
     
     def get_total_disk_usage(self) -> int:
         """Получить общее использование дискового пространства"""
-        total_size = 0
+        # Считаем размер временных файлов и загрузок
+        return sum(self._get_directories_size(self.temp_dir, self.downloads_dir))
+    
+    def _get_directories_size(self, *directories: str) -> List[int]:
+        """
+        Получить размеры нескольких директорий
         
-        # Считаем размер временных файлов
-        if os.path.exists(self.temp_dir):
-            total_size += self._get_directory_size(self.temp_dir)
+        Поддиректории верхнего уровня обходятся параллельно в пуле потоков:
+        работа упирается в stat(), который отпускает GIL.
+        """
+        sizes = [0] * len(directories)
+        subdirs = []  # (индекс корня, путь к поддиректории)
         
-        # Считаем размер загрузок
-        if os.path.exists(self.downloads_dir):
-            total_size += self._get_directory_size(self.downloads_dir)
+        for index, directory in enumerate(directories):
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append((index, entry.path))
+                            elif entry.is_file(follow_symlinks=False):
+                                sizes[index] += entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            pass
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Ошибка получения размера директории {directory}: {e}")
         
-        return total_size
+        if subdirs:
+            max_workers = min(32, (os.cpu_count() or 1) * 4, len(subdirs))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                subdir_sizes = executor.map(self._get_directory_size, [path for _, path in subdirs])
+                for (index, _), size in zip(subdirs, subdir_sizes):
+                    sizes[index] += size
+        
+        return sizes
     
     def _get_directory_size(self, directory: str) -> int:
         """Получить размер директории"""
         total_size = 0
         try:
-            for dirpath, dirnames, filenames in os.walk(directory):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    try:
-                        total_size += os.path.getsize(filepath)
-                    except (OSError, IOError):
-                        pass
+            for entry in _iter_files(directory):
+                try:
+                    total_size += entry.stat(follow_symlinks=False).st_size
+                except (OSError, IOError):
+                    pass
         except Exception as e:
             logger.error(f"Ошибка получения размера директории {directory}: {e}")
         
         return total_size
     
-    def force_cleanup(self):
-        """Принудительная очистка при превышении лимита"""
+    def force_cleanup(self, total_usage: Optional[int] = None):
+        """
+        Принудительная очистка при превышении лимита
+        
+        total_usage - уже известное использование диска: тогда после удаления
+        старых файлов оно пересчитывается вычитанием, без нового обхода
+        """
         try:
             logger.info("Запуск принудительной очистки")
             
             # Сначала очищаем старые файлы (более агрессивно)
-            self.cleanup_old_files(max_age_hours=1)  # Файлы старше 1 часа
+            freed_space = self.cleanup_old_files(max_age_hours=1)  # Файлы старше 1 часа
             
             # Если всё ещё превышен лимит, удаляем самые большие файлы
-            total_usage = self.get_total_disk_usage()
+            if total_usage is None:
+                total_usage = self.get_total_disk_usage()
+            else:
+                total_usage -= freed_space
             if total_usage > self.max_disk_usage:
                 self._cleanup_largest_files()
             
@@ -171,34 +240,26 @@ class CleanupManager:
     def _cleanup_largest_files(self):
         """Удалить самые большие файлы для освобождения места"""
         try:
-            # Собираем информацию о всех файлах
-            files_info = []
-            
-            for directory in [self.temp_dir, self.downloads_dir]:
-                if not os.path.exists(directory):
-                    continue
-                
-                for root, dirs, files in os.walk(directory):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        try:
-                            file_size = os.path.getsize(file_path)
-                            file_time = os.path.getmtime(file_path)
-                            files_info.append((file_path, file_size, file_time))
-                        except (OSError, IOError):
-                            pass
-            
-            # Сортируем по размеру (самые большие сначала)
-            files_info.sort(key=lambda x: x[1], reverse=True)
+            # Собираем информацию о всех файлах, обходя директории параллельно
+            directories = [self.temp_dir, self.downloads_dir]
+            with ThreadPoolExecutor(max_workers=len(directories)) as executor:
+                results = list(executor.map(self._collect_file_info, directories))
+            files_info = [info for infos in results for info in infos]
             
             # Удаляем файлы пока не освободим достаточно места
             target_usage = self.max_disk_usage * 0.8  # Оставляем 20% запаса
-            current_usage = self.get_total_disk_usage()
+            # Список покрывает те же директории, что и get_total_disk_usage, - суммируем его
+            current_usage = sum(file_size for _, file_size, _ in files_info)
             freed_space = 0
             
-            for file_path, file_size, file_time in files_info:
-                if current_usage - freed_space <= target_usage:
-                    break
+            # Куча по размеру (самые большие сначала): heapify за O(N) и извлечение
+            # только тех файлов, что действительно удаляются, вместо полной сортировки
+            heap = [(-file_size, file_path) for file_path, file_size, _ in files_info]
+            heapq.heapify(heap)
+            
+            while heap and current_usage - freed_space > target_usage:
+                neg_size, file_path = heapq.heappop(heap)
+                file_size = -neg_size
                 
                 try:
                     os.remove(file_path)
@@ -215,6 +276,20 @@ class CleanupManager:
         except Exception as e:
             logger.error(f"Ошибка удаления больших файлов: {e}")
     
+    def _collect_file_info(self, directory: str) -> List[Tuple[str, int, float]]:
+        """Собрать (путь, размер, mtime) всех файлов директории"""
+        files_info = []
+        if not os.path.exists(directory):
+            return files_info
+        
+        for entry in _iter_files(directory):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+                files_info.append((entry.path, stat.st_size, stat.st_mtime))
+            except (OSError, IOError):
+                pass
+        return files_info
+    
     def cleanup_user_files(self, user_id: int):
         """Очистить файлы конкретного пользователя"""
         try:
@@ -230,15 +305,9 @@ class CleanupManager:
     def get_disk_usage_stats(self) -> dict:
         """Получить статистику использования диска"""
         try:
-            temp_size = 0
-            downloads_size = 0
-            
-            if os.path.exists(self.temp_dir):
-                temp_size = self._get_directory_size(self.temp_dir)
-            
-            if os.path.exists(self.downloads_dir):
-                downloads_size = self._get_directory_size(self.downloads_dir)
-            
+            temp_size, downloads_size = self._get_directories_size(
+                self.temp_dir, self.downloads_dir
+            )
             total_size = temp_size + downloads_size
             
             return {
@@ -256,13 +325,4 @@ class CleanupManager:
     
     def format_size(self, size_bytes: int) -> str:
         """Форматировать размер в читаемый вид"""
-        if size_bytes == 0:
-            return "0 Б"
-        
-        size_names = ["Б", "КБ", "МБ", "ГБ", "ТБ"]
-        i = 0
-        while size_bytes >= 1024.0 and i < len(size_names) - 1:
-            size_bytes /= 1024.0
-            i += 1
-        
-        return f"{size_bytes:.1f} {size_names[i]}"
\ No newline at end of file
+        return format_size(size_bytes)
\ No newline at end of file
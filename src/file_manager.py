@@ -1,40 +1,117 @@
 """
 Модуль для работы с файлами: проверка размера, разбивка, сжатие
 """
+import io
 import os
+import glob
 import shutil
 import logging
 import subprocess
-from typing import List, Tuple, Optional
+import time
+from typing import Dict, List, Tuple, Optional
 import py7zr
 import psutil
 
-from config import MAX_FILE_SIZE_DIRECT, SPLIT_CHUNK_SIZE, MAX_DISK_USAGE, TEMP_DIR
+from config import MAX_FILE_SIZE_DIRECT, SPLIT_CHUNK_SIZE, MAX_DISK_USAGE, TEMP_DIR_STR
+from src.util import format_size
 
 logger = logging.getLogger(__name__)
 
+DISK_USAGE_CACHE_TTL = 5.0  # Сколько секунд check_disk_space использует посчитанный размер temp-директории
+
+
+def _walk_size(path: str) -> int:
+    """
+    Рекурсивно посчитать размер директории через os.scandir: тип записи берётся
+    из листинга, поэтому на файл приходится один stat вместо двух у os.walk + getsize
+    """
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        total += _walk_size(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return total
+
+
+class _FileSlice(io.BufferedIOBase):
+    """Окно [start, start + length) открытого файла: py7zr читает часть блоками, не загружая её целиком в память"""
+
+    def __init__(self, file, start: int, length: int):
+        self._file = file
+        self._start = start
+        self._length = length
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._length
+        self._pos = min(max(offset, 0), self._length)
+        return self._pos
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        remaining = self._length - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size == 0:
+            return b""
+        self._file.seek(self._start + self._pos)
+        data = self._file.read(size)
+        self._pos += len(data)
+        return data
+
+    read1 = read
+
 
 class FileManager:
     """Менеджер для работы с файлами"""
     
     def __init__(self):
-        self.temp_dir = TEMP_DIR
+        self.temp_dir = TEMP_DIR_STR
+        self._disk_usage_cache: Optional[Tuple[float, int]] = None  # (момент по time.monotonic, размер)
         
     def get_disk_usage(self) -> int:
         """Получить текущее использование диска"""
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(self.temp_dir):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                try:
-                    total_size += os.path.getsize(filepath)
-                except (OSError, IOError):
-                    pass
-        return total_size
+        return _walk_size(self.temp_dir)
     
     def check_disk_space(self, required_space: int) -> bool:
         """Проверить, достаточно ли места на диске"""
-        current_usage = self.get_disk_usage()
+        # Дешёвые проверки первыми: свободное место на разделе - один statvfs,
+        # и запрос, который один превышает лимит, не требует обхода директории
+        if required_space > MAX_DISK_USAGE:
+            return False
+        try:
+            if shutil.disk_usage(self.temp_dir).free < required_space:
+                return False
+        except OSError:
+            pass
+        
+        # Обход temp-директории дорогой, а при отправке многих файлов подряд
+        # проверки идут одна за другой - размер пересчитывается не чаще DISK_USAGE_CACHE_TTL
+        now = time.monotonic()
+        if self._disk_usage_cache and now - self._disk_usage_cache[0] < DISK_USAGE_CACHE_TTL:
+            current_usage = self._disk_usage_cache[1]
+        else:
+            current_usage = self.get_disk_usage()
+            self._disk_usage_cache = (now, current_usage)
         return (current_usage + required_space) <= MAX_DISK_USAGE
     
     def get_file_size(self, filepath: str) -> int:
@@ -44,9 +121,37 @@ class FileManager:
         except (OSError, IOError):
             return 0
     
-    def needs_splitting(self, filepath: str) -> bool:
-        """Проверить, нужно ли разбивать файл"""
-        return self.get_file_size(filepath) > MAX_FILE_SIZE_DIRECT
+    def get_file_sizes(self, filepaths: List[str]) -> Dict[str, int]:
+        """
+        Получить размеры нескольких файлов за один проход os.scandir по каждой директории
+        (на Windows размер берётся из данных листинга без отдельного stat)
+        """
+        by_directory: Dict[str, Dict[str, str]] = {}
+        for filepath in filepaths:
+            dirpath, name = os.path.split(filepath)
+            by_directory.setdefault(dirpath, {})[name] = filepath
+        
+        sizes = dict.fromkeys(filepaths, 0)
+        for dirpath, wanted in by_directory.items():
+            try:
+                with os.scandir(dirpath or '.') as it:
+                    for entry in it:
+                        filepath = wanted.get(entry.name)
+                        if filepath is not None:
+                            try:
+                                sizes[filepath] = entry.stat().st_size
+                            except OSError:
+                                pass
+            except OSError:
+                pass
+        
+        return sizes
+    
+    def needs_splitting(self, filepath: str, file_size: Optional[int] = None) -> bool:
+        """Проверить, нужно ли разбивать файл (file_size - уже известный размер, без stat)"""
+        if file_size is None:
+            file_size = self.get_file_size(filepath)
+        return file_size > MAX_FILE_SIZE_DIRECT
     
     def split_file_7z(self, filepath: str, output_dir: str) -> List[str]:
         """
@@ -61,31 +166,27 @@ class FileManager:
             chunk_size_mb = SPLIT_CHUNK_SIZE // (1024 * 1024)
             
             # Команда для 7z (если установлен системно)
+            # -mx=0: без сжатия (медиа и так сжаты), -mmt=on: все ядра,
+            # -bd -bb0: без индикатора прогресса и лишнего вывода
             cmd = [
-                "7z", "a", 
+                "7z", "a",
+                "-mx=0", "-mmt=on", "-bd", "-bb0",
                 f"-v{chunk_size_mb}m",
                 archive_path,
                 filepath
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = subprocess.run(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                text=True, errors='replace'
+            )
             
             if result.returncode == 0:
-                # Найти все созданные части
-                parts = []
+                # Найти все созданные части одним чтением директории
+                # (номера трёхзначные, поэтому сортировка строк совпадает с порядком частей)
                 base_name = f"{filename}.7z"
-                for i in range(1, 1000):  # Максимум 1000 частей
-                    if i == 1:
-                        part_path = os.path.join(output_dir, f"{base_name}.001")
-                    else:
-                        part_path = os.path.join(output_dir, f"{base_name}.{i:03d}")
-                    
-                    if os.path.exists(part_path):
-                        parts.append(part_path)
-                    else:
-                        break
-                
-                return parts
+                pattern = os.path.join(glob.escape(output_dir), glob.escape(base_name) + '.[0-9][0-9][0-9]')
+                return sorted(glob.glob(pattern))
             else:
                 logger.error(f"Ошибка 7z: {result.stderr}")
                 return self.split_file_py7zr(filepath, output_dir)
@@ -117,25 +218,13 @@ class FileManager:
             part_num = 1
             
             with open(filepath, 'rb') as input_file:
-                while True:
+                for offset in range(0, file_size, SPLIT_CHUNK_SIZE):
                     part_path = os.path.join(output_dir, f"{filename}.7z.{part_num:03d}")
                     
-                    # Читаем часть файла
-                    chunk = input_file.read(SPLIT_CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    
-                    # Создаём временный файл для части
-                    temp_part = os.path.join(output_dir, f"temp_part_{part_num}")
-                    with open(temp_part, 'wb') as temp_file:
-                        temp_file.write(chunk)
-                    
-                    # Сжимаем часть
+                    # Сжимаем часть потоково из исходного файла, без копии в памяти и на диске
+                    chunk = _FileSlice(input_file, offset, min(SPLIT_CHUNK_SIZE, file_size - offset))
                     with py7zr.SevenZipFile(part_path, 'w') as archive:
-                        archive.write(temp_part, f"{filename}.part{part_num:03d}")
-                    
-                    # Удаляем временный файл
-                    os.remove(temp_part)
+                        archive.writef(chunk, f"{filename}.part{part_num:03d}")
                     
                     parts.append(part_path)
                     part_num += 1
@@ -148,6 +237,8 @@ class FileManager:
     
     def cleanup_directory(self, directory: str, exclude_files: Optional[List[str]] = None):
         """Очистить директорию, исключая указанные файлы"""
+        self._disk_usage_cache = None
+        
         if not os.path.exists(directory):
             return
         
@@ -172,29 +263,8 @@ class FileManager:
     
     def get_directory_size(self, directory: str) -> int:
         """Получить размер директории"""
-        total_size = 0
-        try:
-            for dirpath, dirnames, filenames in os.walk(directory):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    try:
-                        total_size += os.path.getsize(filepath)
-                    except (OSError, IOError):
-                        pass
-        except Exception as e:
-            logger.error(f"Ошибка при получении размера директории {directory}: {e}")
-        
-        return total_size
+        return _walk_size(directory)
     
     def format_file_size(self, size_bytes: int) -> str:
         """Форматировать размер файла в читаемый вид"""
-        if size_bytes == 0:
-            return "0 Б"
-        
-        size_names = ["Б", "КБ", "МБ", "ГБ", "ТБ"]
-        i = 0
-        while size_bytes >= 1024.0 and i < len(size_names) - 1:
-            size_bytes /= 1024.0
-            i += 1
-        
-        return f"{size_bytes:.1f} {size_names[i]}"
\ No newline at end of file
+        return format_size(size_bytes)
\ No newline at end of file
@@ -11,6 +11,7 @@ from telegram.error import TelegramError
 from src.userbot.uploader import get_userbot_file_manager, should_use_userbot
 from src.userbot.config import UserbotConfig
 from src.file_manager import FileManager
+from src.util import BOT_API_FILE_LIMIT, format_size, upload_payload
 
 logger = logging.getLogger(__name__)
 
@@ -81,14 +82,15 @@ class SmartFileSender:
         Returns:
             True если файл отправлен успешно
         """
-        if not os.path.exists(file_path):
+        try:
+            file_size = await asyncio.to_thread(os.path.getsize, file_path)
+        except OSError:
             self.logger.error(f"Файл не найден: {file_path}")
             return False
         
         if filename is None:
             filename = os.path.basename(file_path)
         
-        file_size = os.path.getsize(file_path)
         self.logger.info(f"Отправка файла: {filename} ({self._format_size(file_size)})")
         
         # Инициализируем userbot если еще не инициализирован
@@ -100,7 +102,7 @@ class SmartFileSender:
             return await self._send_via_userbot(chat_id, file_path, filename, caption, progress_callback)
         else:
             # Проверяем лимит Bot API (50 МБ - стандартный лимит Telegram Bot API)
-            if file_size > 50 * 1024 * 1024:  # 50 МБ
+            if file_size > BOT_API_FILE_LIMIT:
                 self.logger.info(f"Разбиваем файл на части: {filename}")
                 return await self._send_via_split(chat_id, file_path, filename, caption)
             else:
@@ -189,10 +191,10 @@ class SmartFileSender:
             True если успешно отправлено
         """
         try:
-            with open(file_path, 'rb') as file:
+            async with upload_payload(file_path) as document:
                 await self.bot.send_document(
                     chat_id=chat_id,
-                    document=file,
+                    document=document,
                     filename=filename,
                     caption=caption
                 )
@@ -233,22 +235,25 @@ class SmartFileSender:
             )
             
             # Используем существующий метод разбиения из FileManager
-            if self.file_manager.needs_splitting(file_path):
-                parts = self.file_manager.split_file_7z(file_path, os.path.dirname(file_path))
+            # (stat и сжатие 7z на несколько ГБ - в потоке, чтобы не останавливать цикл событий)
+            if await asyncio.to_thread(self.file_manager.needs_splitting, file_path):
+                parts = await asyncio.to_thread(
+                    self.file_manager.split_file_7z, file_path, os.path.dirname(file_path)
+                )
                 
                 for i, part_path in enumerate(parts, 1):
                     try:
                         part_filename = f"{filename}.part{i}"
-                        with open(part_path, 'rb') as part_file:
+                        async with upload_payload(part_path) as document:
                             await self.bot.send_document(
                                 chat_id=chat_id,
-                                document=part_file,
+                                document=document,
                                 filename=part_filename,
                                 caption=f"Часть {i}/{len(parts)}" + (f"\n{caption}" if caption and i == 1 else "")
                             )
                         
                         # Удаляем временную часть
-                        os.remove(part_path)
+                        await asyncio.to_thread(os.remove, part_path)
                         
                     except Exception as e:
                         self.logger.error(f"Ошибка отправки части {i}: {e}")
@@ -266,12 +271,7 @@ class SmartFileSender:
     
     def _format_size(self, size: int) -> str:
         """Форматирование размера файла."""
-        size_float = float(size)
-        for unit in ['Б', 'КБ', 'МБ', 'ГБ']:
-            if size_float < 1024.0:
-                return f"{size_float:.1f} {unit}"
-            size_float /= 1024.0
-        return f"{size_float:.1f} ТБ"
+        return format_size(size)
     
     async def is_userbot_available(self) -> bool:
         """Проверка доступности userbot."""
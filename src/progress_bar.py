@@ -6,6 +6,8 @@ import math
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 
+from src.util import format_size
+
 
 class ProgressBar:
     """Класс для создания визуального прогресс-бара"""
@@ -59,7 +61,8 @@ class ProgressBar:
         
         return bar
     
-    def format_speed(self, bytes_per_second: int) -> str:
+    @staticmethod
+    def format_speed(bytes_per_second: int) -> str:
         """Форматировать скорость загрузки"""
         if bytes_per_second == 0:
             return "0 Б/с"
@@ -74,22 +77,13 @@ class ProgressBar:
         
         return f"{speed:.1f} {units[unit_index]}"
     
-    def format_size(self, bytes_size: int) -> str:
+    @staticmethod
+    def format_size(bytes_size: int) -> str:
         """Форматировать размер файла"""
-        if bytes_size == 0:
-            return "0 Б"
-        
-        units = ["Б", "КБ", "МБ", "ГБ", "ТБ"]
-        unit_index = 0
-        size = float(bytes_size)
-        
-        while size >= 1024 and unit_index < len(units) - 1:
-            size /= 1024
-            unit_index += 1
-        
-        return f"{size:.1f} {units[unit_index]}"
+        return format_size(bytes_size)
     
-    def format_time(self, seconds: int) -> str:
+    @staticmethod
+    def format_time(seconds: int) -> str:
         """Форматировать время"""
         if seconds <= 0 or seconds > 8640000:  # Больше 100 дней
             return "∞"
@@ -97,16 +91,14 @@ class ProgressBar:
         if seconds < 60:
             return f"{seconds}с"
         elif seconds < 3600:
-            minutes = seconds // 60
-            return f"{minutes}м {seconds % 60}с"
+            minutes, secs = divmod(seconds, 60)
+            return f"{minutes}м {secs}с"
         elif seconds < 86400:
-            hours = seconds // 3600
-            minutes = (seconds % 3600) // 60
-            return f"{hours}ч {minutes}м"
+            hours, rest = divmod(seconds, 3600)
+            return f"{hours}ч {rest // 60}м"
         else:
-            days = seconds // 86400
-            hours = (seconds % 86400) // 3600
-            return f"{days}д {hours}ч"
+            days, rest = divmod(seconds, 86400)
+            return f"{days}д {rest // 3600}ч"
     
     def create_detailed_message(self, info: Dict[str, Any]) -> str:
         """
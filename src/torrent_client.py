@@ -4,7 +4,8 @@
 import os
 import time
 import logging
-from typing import Optional, Dict, Any, List, Union
+import threading
+from typing import Optional, Dict, Any, List, Sequence, Union
 import qbittorrentapi
 import tempfile
 import requests
@@ -12,22 +13,47 @@ import requests
 from config import (
     QBITTORRENT_HOST, QBITTORRENT_PORT, 
     QBITTORRENT_USERNAME, QBITTORRENT_PASSWORD,
-    DOWNLOADS_DIR
+    DOWNLOADS_DIR_STR
 )
 
 logger = logging.getLogger(__name__)
 
+# Интервал опроса состояния торрента при ожидании завершения (секунды)
+POLL_INTERVAL = 5
+
+# Сколько секунд считать успешную проверку подключения действительной
+CONNECTION_CHECK_TTL = 5.0
+
+# Скачано: раздаётся, нет пиров, в очереди, приостановлено, принудительная раздача
+COMPLETED_STATES = frozenset({'uploading', 'stalledUP', 'queuedUP', 'pausedUP', 'forcedUP'})
+
+# Ошибка, отсутствуют файлы, неизвестное состояние
+ERROR_STATES = frozenset({'error', 'missingFiles', 'unknown'})
+
+# Скачивание, проверка, перемещение и выделение места - продолжаем ждать
+DOWNLOADING_STATES = frozenset({
+    'downloading', 'stalledDL', 'queuedDL', 'pausedDL',
+    'checkingUP', 'checkingDL', 'queuedForChecking', 'checkingResumeData',
+    'moving', 'allocating'
+})
+
 
 class TorrentClient:
     """Клиент для работы с qBittorrent"""
     
     def __init__(self):
         self.client: Optional[qbittorrentapi.Client] = None
-        self.downloads_dir = DOWNLOADS_DIR
+        self.downloads_dir = DOWNLOADS_DIR_STR
+        self._connected_at = 0.0  # time.monotonic() последней успешной проверки подключения
+        # Добавления выполняются в разных потоках (обновления обрабатываются параллельно).
+        # Пока одно добавление ищет свой торрент сравнением списков до и после, другие
+        # не должны добавлять торренты - иначе в разнице окажется чужой торрент
+        self._add_lock = threading.RLock()
         self._connect()
     
     def _connect(self):
         """Подключиться к qBittorrent"""
+        self._connected_at = 0.0
         try:
             self.client = qbittorrentapi.Client(
                 host=QBITTORRENT_HOST,
@@ -74,16 +100,21 @@ class TorrentClient:
             logger.error(f"Ошибка настройки папки загрузок: {e}")
     
     def is_connected(self) -> bool:
-        """Проверить подключение к клиенту"""
+        """Проверить подключение к клиенту (успешный результат кэшируется на CONNECTION_CHECK_TTL)"""
+        if self.client is None:
+            return False
+        
+        if time.monotonic() - self._connected_at < CONNECTION_CHECK_TTL:
+            return True
+        
         try:
-            if self.client is None:
-                return False
-            
             # Простая проверка - получаем версию
             self.client.app_version()
+            self._connected_at = time.monotonic()
             return True
             
         except Exception:
+            self._connected_at = 0.0
             return False
     
     def add_torrent_file(self, torrent_data: bytes, filename: str) -> Optional[str]:
@@ -91,6 +122,12 @@ class TorrentClient:
         Добавить торрент из файла
         Возвращает hash торрента или None при ошибке
         """
+        # Хеш ищется сравнением списков - весь путь от снимка до поиска под блокировкой
+        with self._add_lock:
+            return self._add_torrent_file(torrent_data, filename)
+    
+    def _add_torrent_file(self, torrent_data: bytes, filename: str) -> Optional[str]:
+        """Добавить торрент из файла (вызывается под self._add_lock)"""
         try:
             if not self.is_connected():
                 self._connect()
@@ -255,13 +292,26 @@ class TorrentClient:
                     
         except Exception as e:
             logger.error(f"Ошибка добавления торрент-файла: {e}", exc_info=True)
+            self._connected_at = 0.0  # Перепроверим подключение при следующем обращении
             return None
     
-    def add_magnet_link(self, magnet_link: str) -> Optional[str]:
+    def add_magnet_link(self, magnet_link: str, info_hashes: Sequence[str] = ()) -> Optional[str]:
         """
         Добавить торрент по magnet-ссылке
+        info_hashes - возможные идентификаторы торрента из самой ссылки (hex, нижний регистр):
+        хеш v1 и усечённый хеш v2. Если они известны, торрент ищется по ним,
+        без сравнения полных списков торрентов
         Возвращает hash торрента или None при ошибке
         """
+        if info_hashes:
+            return self._add_magnet_link(magnet_link, info_hashes)
+        
+        # Хеш ищется сравнением списков - весь путь от снимка до поиска под блокировкой
+        with self._add_lock:
+            return self._add_magnet_link(magnet_link, info_hashes)
+    
+    def _add_magnet_link(self, magnet_link: str, info_hashes: Sequence[str]) -> Optional[str]:
+        """Добавить торрент по magnet-ссылке (без info_hashes вызывается под self._add_lock)"""
         try:
             if not self.is_connected():
                 self._connect()
@@ -271,20 +321,23 @@ class TorrentClient:
             
             logger.info(f"Добавление magnet-ссылки...")
             
-            # Получаем список торрентов до добавления
+            # Получаем список торрентов до добавления (не нужен, если хеш известен заранее)
             existing_torrents = set()
-            try:
-                existing_list = self.client.torrents_info()
-                existing_torrents = {t.hash for t in existing_list}
-                logger.info(f"Существующих торрентов: {len(existing_torrents)}")
-            except Exception as e:
-                logger.warning(f"Не удалось получить список существующих торрентов: {e}")
+            if not info_hashes:
+                try:
+                    existing_list = self.client.torrents_info()
+                    existing_torrents = {t.hash for t in existing_list}
+                    logger.info(f"Существующих торрентов: {len(existing_torrents)}")
+                except Exception as e:
+                    logger.warning(f"Не удалось получить список существующих торрентов: {e}")
             
-            # Добавляем магнет-ссылку
-            result = self.client.torrents_add(
-                urls=magnet_link,
-                save_path=self.downloads_dir
-            )
+            # Добавляем магнет-ссылку; с известным хешем блокировка нужна только на само
+            # добавление, чтобы не попасть в окно сравнения списков другого потока
+            with self._add_lock:
+                result = self.client.torrents_add(
+                    urls=magnet_link,
+                    save_path=self.downloads_dir
+                )
             
             logger.info(f"Результат добавления magnet: {result}")
             
@@ -294,6 +347,22 @@ class TorrentClient:
                     time.sleep(1)  # Ждём 1 секунду между попытками
                     
                     try:
+                        if info_hashes:
+                            # Запрашиваем только нужный торрент (гибридный qBittorrent
+                            # показывает под хешем v2, поэтому спрашиваем все варианты)
+                            found = self.client.torrents_info(torrent_hashes=list(info_hashes))
+                            if len(found) > 1:
+                                # Хеши ссылки указывают на разные торренты - какой из них
+                                # добавлен сейчас, по ним не определить, угадывать нельзя
+                                logger.error(f"Хеши magnet-ссылки соответствуют {len(found)} торрентам: "
+                                             f"{', '.join(t.hash for t in found)}")
+                                return None
+                            if found:
+                                logger.info(f"Magnet-ссылка успешно добавлена: {found[0].name} ({found[0].hash})")
+                                return found[0].hash
+                            logger.info(f"Попытка {attempt + 1}/15: торрент ещё не появился в списке")
+                            continue
+                        
                         current_torrents = self.client.torrents_info()
                         current_hashes = {t.hash for t in current_torrents}
                         
@@ -314,6 +383,9 @@ class TorrentClient:
                         logger.warning(f"Ошибка при проверке торрентов (попытка {attempt + 1}): {e}")
                 
                 # Последняя попытка - берём самый последний добавленный
+                # (с известным хешем угадывать нельзя: это может быть чужой торрент)
+                if info_hashes:
+                    return None
                 try:
                     all_torrents = self.client.torrents_info()
                     if all_torrents:
@@ -329,8 +401,44 @@ class TorrentClient:
             
         except Exception as e:
             logger.error(f"Ошибка добавления magnet-ссылки: {e}", exc_info=True)
+            self._connected_at = 0.0  # Перепроверим подключение при следующем обращении
             return None
     
+    def get_torrent_info_from(self, torrent, files_count: Optional[int] = None) -> Dict[str, Any]:
+        """Построить словарь информации из уже полученного объекта torrents_info() без запросов к API"""
+        if files_count is None:
+            files_count = getattr(torrent, 'num_files', 0)
+        
+        return {
+            'name': torrent.name,
+            'state': torrent.state,
+            'progress': torrent.progress * 100,  # Переводим в проценты
+            'size': torrent.size,
+            'downloaded': torrent.downloaded,
+            'download_speed': torrent.dlspeed,
+            'eta': torrent.eta,
+            'files_count': files_count,
+            'hash': torrent.hash,
+            'priority': getattr(torrent, 'priority', 0),
+            'ratio': getattr(torrent, 'ratio', None) or 0.0,
+            'uploaded': getattr(torrent, 'uploaded', None) or 0,
+            'upspeed': getattr(torrent, 'upspeed', None) or 0,
+            'completed': getattr(torrent, 'completed', 0),
+            'completion_on': getattr(torrent, 'completion_on', 0)
+        }
+    
+    def get_all_torrents_info(self) -> List[Dict[str, Any]]:
+        """Получить информацию обо всех торрентах одним запросом к API"""
+        try:
+            if not self.is_connected() or not self.client:
+                return []
+            
+            return [self.get_torrent_info_from(torrent) for torrent in self.client.torrents_info()]
+            
+        except Exception as e:
+            logger.error(f"Ошибка получения списка торрентов: {e}")
+            return []
+    
     def get_torrent_info(self, torrent_hash: str) -> Optional[Dict[str, Any]]:
         """Получить информацию о торренте"""
         try:
@@ -348,25 +456,9 @@ class TorrentClient:
                     files_count = len(files) if files else 0
                 except Exception as files_error:
                     logger.warning(f"Не удалось получить количество файлов: {files_error}")
-                    files_count = getattr(torrent, 'num_files', 0)
+                    files_count = None
                 
-                return {
-                    'name': torrent.name,
-                    'state': torrent.state,
-                    'progress': torrent.progress * 100,  # Переводим в проценты
-                    'size': torrent.size,
-                    'downloaded': torrent.downloaded,
-                    'download_speed': torrent.dlspeed,
-                    'eta': torrent.eta,
-                    'files_count': files_count,
-                    'hash': torrent.hash,
-                    'priority': getattr(torrent, 'priority', 0),
-                    'ratio': getattr(torrent, 'ratio', 0),
-                    'uploaded': getattr(torrent, 'uploaded', 0),
-                    'upspeed': getattr(torrent, 'upspeed', 0),
-                    'completed': getattr(torrent, 'completed', 0),
-                    'completion_on': getattr(torrent, 'completion_on', 0)
-                }
+                return self.get_torrent_info_from(torrent, files_count)
             
             return None
             
@@ -374,9 +466,35 @@ class TorrentClient:
             logger.error(f"Ошибка получения информации о торренте: {e}")
             return None
     
+    def check_completion(self, torrent_hash: str, info: Optional[Dict[str, Any]]) -> Optional[bool]:
+        """
+        Проверить состояние торрента при ожидании завершения
+        Возвращает True - скачан, False - ошибка, None - нужно ждать дальше
+        """
+        if info is None:
+            logger.error("Торрент не найден или ошибка получения информации")
+            return False
+        
+        state = info['state']
+        logger.debug(f"Торрент {torrent_hash}: состояние={state}, прогресс={info['progress']:.1f}%")
+        
+        if state in COMPLETED_STATES:
+            logger.info(f"Торрент {torrent_hash} скачан успешно (состояние: {state})")
+            return True
+        
+        if state in ERROR_STATES:
+            logger.error(f"Ошибка скачивания торрента {torrent_hash}: состояние {state}")
+            return False
+        
+        if state not in DOWNLOADING_STATES:
+            # Неизвестное состояние - логируем и продолжаем
+            logger.warning(f"Неизвестное состояние торрента {torrent_hash}: {state}")
+        
+        return None
+    
     def wait_for_completion(self, torrent_hash: str, progress_callback=None) -> bool:
         """
-        Ждать завершения скачивания торрента
+        Ждать завершения скачивания торрента (блокирующий вариант)
         progress_callback: функция для отправки обновлений прогресса
         """
         try:
@@ -385,68 +503,18 @@ class TorrentClient:
             while True:
                 info = self.get_torrent_info(torrent_hash)
                 
-                if info is None:
-                    logger.error("Торрент не найден или ошибка получения информации")
-                    return False
-                
-                state = info['state']
-                progress = info['progress']
-                
-                logger.debug(f"Торрент {torrent_hash}: состояние={state}, прогресс={progress:.1f}%")
-                
                 # Отправляем обновление прогресса
-                if progress_callback:
+                if info is not None and progress_callback:
                     try:
                         progress_callback(info)
                     except Exception as callback_error:
                         logger.warning(f"Ошибка callback функции: {callback_error}")
                 
-                # Проверяем состояние завершения
-                completed_states = [
-                    'uploading',     # Скачано, раздается
-                    'stalledUP',     # Скачано, нет пиров для раздачи
-                    'queuedUP',      # В очереди на раздачу
-                    'pausedUP',      # Приостановлено после завершения
-                    'forcedUP'       # Принудительная раздача
-                ]
-                
-                if state in completed_states:
-                    logger.info(f"Торрент {torrent_hash} скачан успешно (состояние: {state})")
-                    return True
-                
-                # Проверяем состояния ошибки
-                error_states = [
-                    'error',         # Ошибка
-                    'missingFiles',  # Отсутствуют файлы
-                    'unknown'        # Неизвестное состояние
-                ]
-                
-                if state in error_states:
-                    logger.error(f"Ошибка скачивания торрента {torrent_hash}: состояние {state}")
-                    return False
-                
-                # Состояния скачивания - продолжаем ждать
-                downloading_states = [
-                    'downloading',   # Скачивается
-                    'stalledDL',     # Скачивание приостановлено (нет пиров)
-                    'queuedDL',      # В очереди на скачивание
-                    'pausedDL',      # Приостановлено пользователем
-                    'checkingUP',    # Проверка после скачивания
-                    'checkingDL',    # Проверка при скачивании
-                    'queuedForChecking',  # В очереди на проверку
-                    'checkingResumeData', # Проверка данных при возобновлении
-                    'moving',        # Перемещение файлов
-                    'allocating'     # Выделение места на диске
-                ]
-                
-                if state in downloading_states:
-                    # Ждём и продолжаем
-                    time.sleep(5)
-                    continue
+                result = self.check_completion(torrent_hash, info)
+                if result is not None:
+                    return result
                 
-                # Неизвестное состояние - логируем и продолжаем
-                logger.warning(f"Неизвестное состояние торрента {torrent_hash}: {state}")
-                time.sleep(5)
+                time.sleep(POLL_INTERVAL)
                 
         except Exception as e:
             logger.error(f"Ошибка ожидания завершения торрента: {e}", exc_info=True)
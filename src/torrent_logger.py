@@ -2,16 +2,41 @@
 Модуль для детального логирования операций бота
 """
 import os
+import gzip
+import atexit
 import logging
 import json
+from collections import Counter
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterator
 from dataclasses import dataclass, asdict
 import sqlite3
 import threading
 
 from config import LOGS_DIR
 
+UPDATE_FLUSH_INTERVAL = 1.0  # Сколько секунд после первого изменения статуса копить пачку перед записью в БД
+
+try:
+    # orjson - опциональная зависимость, ускоряет экспорт логов
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps_line(obj: Dict[str, Any]) -> bytes:
+    """Сериализовать запись в одну строку JSON Lines (с переводом строки)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+    return (json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _dumps_pretty(obj: Dict[str, Any]) -> bytes:
+    """Сериализовать запись с отступами для JSON-массива"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
 
 @dataclass
 class TorrentOperation:
@@ -33,9 +58,6 @@ class TorrentLogger:
     """Расширенный логгер для операций с торрентами"""
     
     def __init__(self):
-        # Гарантируем существование директории логов до любых операций
-        os.makedirs(LOGS_DIR, exist_ok=True)
-
         # Настраиваем обычный логгер как можно раньше (до БД)
         self.logger = logging.getLogger('torrent_operations')
         if not self.logger.handlers:
@@ -61,13 +83,40 @@ class TorrentLogger:
         self.db_path = os.path.join(LOGS_DIR, 'torrent_operations.db')
         self.lock = threading.Lock()
         self._init_database()
+        
+        # Изменения статусов копятся в памяти и пишутся в БД пачкой фоновым потоком:
+        # вызов из обработчика бота не ждёт записи на диск. Поток спит, пока нечего писать
+        self._pending_updates = []  # (status, error_message, details, operation_id)
+        self._pending_lock = threading.Lock()
+        self._pending_event = threading.Event()  # Установлен - есть изменения для записи
+        self._stop_event = threading.Event()  # Установлен - поток записи должен завершиться
+        self._flush_thread = threading.Thread(
+            target=self._flush_loop, name='torrent-logger-flush', daemon=True
+        )
+        self._flush_thread.start()
+        atexit.register(self.close)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть соединение с БД логов с настройками под частую запись"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        return conn
     
     def _init_database(self):
         """Инициализировать базу данных для логов"""
         try:
             # Убедимся, что каталог для БД существует
             os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
+                # Разрешает PRAGMA incremental_vacuum. Для новой БД режим применяется сразу,
+                # существующую переводим в него один раз через VACUUM
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    self.logger.info("Перевод БД логов в режим auto_vacuum=INCREMENTAL (однократный VACUUM)")
+                    conn.execute('VACUUM')
+                
                 conn.execute('''
                     CREATE TABLE IF NOT EXISTS operations (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -85,11 +134,19 @@ class TorrentLogger:
                     )
                 ''')
                 
-                # Индексы для быстрого поиска
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_user_id ON operations(user_id)')
+                # Индексы под запросы статистики, очистки и выборки по пользователю
                 conn.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON operations(timestamp)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_status ON operations(status)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_operation_type ON operations(operation_type)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_type_timestamp ON operations(operation_type, timestamp)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_status_timestamp ON operations(status, timestamp)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_user_timestamp ON operations(user_id, timestamp)')
+                
+                # Одностолбцовые индексы покрываются составными выше
+                conn.execute('DROP INDEX IF EXISTS idx_user_id')
+                conn.execute('DROP INDEX IF EXISTS idx_status')
+                conn.execute('DROP INDEX IF EXISTS idx_operation_type')
+                
+                # WAL сохраняется в файле БД: читатели не блокируют запись
+                conn.execute('PRAGMA journal_mode=WAL')
                 
         except Exception as e:
             # На случай если logger ещё не готов, используем print как последний фолбэк
@@ -102,7 +159,7 @@ class TorrentLogger:
         """Записать операцию в лог"""
         try:
             with self.lock:
-                with sqlite3.connect(self.db_path) as conn:
+                with self._connect() as conn:
                     cursor = conn.execute('''
                         INSERT INTO operations 
                         (user_id, user_name, operation_type, torrent_hash, torrent_name, 
@@ -145,28 +202,61 @@ class TorrentLogger:
     def update_operation_status(self, operation_id: int, status: str, 
                               error_message: Optional[str] = None,
                               details: Optional[Dict[str, Any]] = None):
-        """Обновить статус операции"""
+        """Обновить статус операции (запись в БД выполняется при ближайшем flush)"""
+        with self._pending_lock:
+            self._pending_updates.append((
+                status,
+                error_message,
+                json.dumps(details) if details else None,
+                operation_id
+            ))
+        self._pending_event.set()
+    
+    def flush(self):
+        """Записать накопленные изменения статусов в БД одной транзакцией"""
+        with self._pending_lock:
+            updates, self._pending_updates = self._pending_updates, []
+        
+        if not updates:
+            return
+        
         try:
             with self.lock:
-                with sqlite3.connect(self.db_path) as conn:
-                    conn.execute('''
+                with self._connect() as conn:
+                    conn.executemany('''
                         UPDATE operations 
                         SET status = ?, error_message = ?, details = ?
                         WHERE id = ?
-                    ''', (
-                        status,
-                        error_message,
-                        json.dumps(details) if details else None,
-                        operation_id
-                    ))
+                    ''', updates)
                     
         except Exception as e:
-            self.logger.error(f"Ошибка обновления статуса операции {operation_id}: {e}")
+            # Возвращаем изменения в начало очереди: их запишет следующий flush
+            with self._pending_lock:
+                self._pending_updates[:0] = updates
+            self.logger.error(f"Ошибка обновления статусов операций ({len(updates)} шт.), "
+                              f"повторим при следующей записи: {e}")
+    
+    def _flush_loop(self):
+        """Фоновый поток: дождаться изменений статусов, накопить пачку и записать её в БД"""
+        while not self._stop_event.is_set():
+            self._pending_event.wait()
+            # Копим пачку; при остановке ожидание прерывается сразу
+            self._stop_event.wait(UPDATE_FLUSH_INTERVAL)
+            self._pending_event.clear()
+            self.flush()
+    
+    def close(self):
+        """Остановить поток записи и сбросить оставшиеся изменения в БД (повторный вызов безопасен)"""
+        self._stop_event.set()
+        self._pending_event.set()
+        self._flush_thread.join(timeout=5)
+        self.flush()
     
     def get_user_operations(self, user_id: int, limit: int = 10) -> list:
         """Получить последние операции пользователя"""
+        self.flush()
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.execute('''
                     SELECT * FROM operations 
@@ -183,59 +273,56 @@ class TorrentLogger:
     
     def get_operation_stats(self, days: int = 7) -> Dict[str, Any]:
         """Получить статистику операций за последние дни"""
+        self.flush()
         try:
-            from_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            period = (f'-{int(days)} days',)
             
-            with sqlite3.connect(self.db_path) as conn:
-                # Общее количество операций
+            with self._connect() as conn:
+                # Сначала дешёвый COUNT по индексу: при пустом периоде остальные запросы не нужны
                 total_ops = conn.execute('''
                     SELECT COUNT(*) FROM operations 
-                    WHERE timestamp >= datetime('now', '-{} days')
-                '''.format(days)).fetchone()[0]
+                    WHERE timestamp >= datetime('now', ?)
+                ''', period).fetchone()[0]
+                if not total_ops:
+                    return {'total_operations': 0, 'period_days': days}
                 
-                # Статистика по типам операций
-                ops_by_type = conn.execute('''
-                    SELECT operation_type, COUNT(*) as count
-                    FROM operations 
-                    WHERE timestamp >= datetime('now', '-{} days')
-                    GROUP BY operation_type
-                '''.format(days)).fetchall()
+                by_type = Counter()
+                by_status = Counter()
+                total_size = 0
                 
-                # Статистика по статусам
-                ops_by_status = conn.execute('''
-                    SELECT status, COUNT(*) as count
+                # Разрезы по типам и статусам собираются из одного сгруппированного прохода
+                rows = conn.execute('''
+                    SELECT operation_type, status, COUNT(*),
+                           SUM(CASE WHEN status = 'completed' THEN file_size END)
                     FROM operations 
-                    WHERE timestamp >= datetime('now', '-{} days')
-                    GROUP BY status
-                '''.format(days)).fetchall()
+                    WHERE timestamp >= datetime('now', ?)
+                    GROUP BY operation_type, status
+                ''', period)
                 
-                # Самые активные пользователи
+                for op_type, status, count, size in rows:
+                    total_size += size or 0
+                    by_type[op_type] += count
+                    by_status[status] += count
+                
+                # Самые активные пользователи: сортировка и LIMIT на стороне sqlite
                 active_users = conn.execute('''
-                    SELECT user_id, user_name, COUNT(*) as count
+                    SELECT user_id, user_name, COUNT(*) AS count
                     FROM operations 
-                    WHERE timestamp >= datetime('now', '-{} days')
+                    WHERE timestamp >= datetime('now', ?)
                     GROUP BY user_id, user_name
                     ORDER BY count DESC
-                    LIMIT 5
-                '''.format(days)).fetchall()
-                
-                # Общий размер переданных файлов
-                total_size = conn.execute('''
-                    SELECT SUM(file_size) FROM operations 
-                    WHERE timestamp >= datetime('now', '-{} days')
-                    AND file_size IS NOT NULL
-                    AND status = 'completed'
-                '''.format(days)).fetchone()[0] or 0
-                
-                return {
-                    'total_operations': total_ops,
-                    'operations_by_type': {row[0]: row[1] for row in ops_by_type},
-                    'operations_by_status': {row[0]: row[1] for row in ops_by_status},
-                    'active_users': [{'user_id': row[0], 'user_name': row[1], 'count': row[2]} 
-                                   for row in active_users],
-                    'total_transferred_bytes': total_size,
-                    'period_days': days
-                }
+                    LIMIT 10
+                ''', period).fetchall()
+            
+            return {
+                'total_operations': total_ops,
+                'operations_by_type': dict(by_type),
+                'operations_by_status': dict(by_status),
+                'active_users': [{'user_id': row[0], 'user_name': row[1], 'count': row[2]}
+                                 for row in active_users],
+                'total_transferred_bytes': total_size,
+                'period_days': days
+            }
                 
         except Exception as e:
             self.logger.error(f"Ошибка получения статистики: {e}")
@@ -317,48 +404,102 @@ class TorrentLogger:
         """Логировать ошибку операции"""
         self.update_operation_status(operation_id, 'failed', error_message=error_message)
     
-    def cleanup_old_logs(self, days_to_keep: int = 30):
-        """Очистить старые логи"""
+    def cleanup_old_logs(self, days_to_keep: int = 30) -> int:
+        """Очистить старые логи, вернуть количество удалённых записей"""
+        self.flush()
         try:
             with self.lock:
-                with sqlite3.connect(self.db_path) as conn:
-                    deleted_count = conn.execute('''
-                        DELETE FROM operations 
-                        WHERE timestamp < datetime('now', '-{} days')
-                    '''.format(days_to_keep)).rowcount
+                conn = self._connect()
+                try:
+                    # Одна транзакция и один диапазонный DELETE по индексу timestamp
+                    with conn:
+                        deleted_count = conn.execute('''
+                            DELETE FROM operations 
+                            WHERE timestamp < datetime('now', ?)
+                        ''', (f'-{int(days_to_keep)} days',)).rowcount
                     
-                    if deleted_count > 0:
-                        self.logger.info(f"Удалено {deleted_count} старых записей из логов")
+                    # После крупной очистки возвращаем часть свободных страниц
+                    if deleted_count > 10_000:
+                        conn.execute('PRAGMA incremental_vacuum(1000)')
+                finally:
+                    conn.close()
+            
+            if deleted_count > 0:
+                self.logger.info(f"Удалено {deleted_count} старых записей из логов")
+            
+            return deleted_count
                         
         except Exception as e:
             self.logger.error(f"Ошибка очистки старых логов: {e}")
+            return 0
     
-    def export_logs_to_json(self, output_file: str, days: int = 7) -> bool:
-        """Экспортировать логи в JSON файл"""
+    def iter_operations(self, days: int = 7, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Построчно выдавать операции за последние дни, не загружая всю выборку в память"""
+        self.flush()
+        conn = self._connect()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.execute('''
-                    SELECT * FROM operations 
-                    WHERE timestamp >= datetime('now', '-{} days')
-                    ORDER BY timestamp DESC
-                '''.format(days))
-                
-                operations = [dict(row) for row in cursor.fetchall()]
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute('''
+                SELECT * FROM operations 
+                WHERE timestamp >= datetime('now', ?)
+                ORDER BY timestamp DESC
+            ''', (f'-{int(days)} days',))
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
                 
-                # Парсим JSON в details
-                for op in operations:
+                for row in rows:
+                    op = dict(row)
+                    # Парсим JSON в details
                     if op['details']:
                         try:
                             op['details'] = json.loads(op['details'])
-                        except:
+                        except ValueError:
                             pass
-                
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(operations, f, indent=2, ensure_ascii=False)
-                
-                self.logger.info(f"Логи экспортированы в {output_file}")
-                return True
+                    yield op
+        finally:
+            conn.close()
+    
+    def _open_export_file(self, output_file: str):
+        """Открыть файл экспорта на бинарную запись, выбрав сжатие по расширению"""
+        if output_file.endswith('.gz'):
+            return gzip.open(output_file, 'wb', compresslevel=1)
+        
+        if output_file.endswith('.zst'):
+            # zstandard - опциональная зависимость, нужна только для .zst
+            import zstandard
+            return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(
+                open(output_file, 'wb')
+            )
+        
+        return open(output_file, 'wb', buffering=1 << 20)
+    
+    def export_logs_to_json(self, output_file: str, days: int = 7, jsonl: bool = False) -> bool:
+        """
+        Экспортировать логи в JSON файл
+        
+        При jsonl=True каждая операция пишется отдельной строкой (JSON Lines),
+        иначе записывается JSON-массив. В обоих случаях записи выгружаются потоково.
+        Файлы с расширением .gz/.zst сжимаются на лету.
+        """
+        try:
+            with self._open_export_file(output_file) as f:
+                if jsonl:
+                    for op in self.iter_operations(days):
+                        f.write(_dumps_line(op))
+                else:
+                    f.write(b'[')
+                    separator = b'\n'
+                    for op in self.iter_operations(days):
+                        f.write(separator)
+                        f.write(_dumps_pretty(op))
+                        separator = b',\n'
+                    f.write(b'\n]' if separator != b'\n' else b']')
+            
+            self.logger.info(f"Логи экспортированы в {output_file}")
+            return True
                 
         except Exception as e:
             self.logger.error(f"Ошибка экспорта логов: {e}")
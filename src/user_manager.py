@@ -4,11 +4,19 @@
 import sqlite3
 import os
 import threading
+import time
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 from config import LOGS_DIR
 
+ROLE_CACHE_TTL = 60.0  # Сколько секунд роль пользователя берётся из памяти без запроса к БД
+ROLE_CACHE_SIZE = 5000  # Максимум пользователей в кэше ролей
+LAST_ACTIVE_INTERVAL = 30.0  # Не чаще, чем раз в столько секунд, пишем last_active пользователя
+
+_MISSING = object()
+
 
 class UserManager:
     """Менеджер для управления доступом пользователей"""
@@ -16,6 +24,9 @@ class UserManager:
     def __init__(self):
         self.db_path = os.path.join(LOGS_DIR, 'users.db')
         self.lock = threading.Lock()
+        # user_id -> (роль или None, момент запроса по time.monotonic)
+        self._role_cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._last_active_at: Dict[int, float] = {}
         self._init_database()
         
         # Загружаем админов из конфигурации
@@ -49,10 +60,10 @@ class UserManager:
     def _load_initial_admins(self):
         """Загрузить начальных админов из конфигурации"""
         try:
-            from config import AUTHORIZED_USERS
+            from config import AUTHORIZED_USERS_ORDERED
             
-            if AUTHORIZED_USERS:
-                for user_id in AUTHORIZED_USERS:
+            if AUTHORIZED_USERS_ORDERED:
+                for user_id in AUTHORIZED_USERS_ORDERED:
                     if not self.user_exists(user_id):
                         self.add_user(
                             user_id=user_id,
@@ -74,39 +85,50 @@ class UserManager:
         except Exception:
             return False
     
-    def is_authorized(self, user_id: int) -> bool:
-        """Проверить, авторизован ли пользователь"""
+    def _invalidate_role(self, user_id: int):
+        """Сбросить закэшированную роль пользователя (вызывается под self.lock)"""
+        self._role_cache.pop(user_id, None)
+    
+    def get_role(self, user_id: int) -> Optional[str]:
+        """Получить роль активного пользователя (None, если пользователь не найден или отключён)"""
         try:
             with self.lock:
+                now = time.monotonic()
+                cached = self._role_cache.get(user_id, _MISSING)
+                if cached is not _MISSING and now - cached[1] < ROLE_CACHE_TTL:
+                    self._role_cache.move_to_end(user_id)
+                    return cached[0]
+                
                 with sqlite3.connect(self.db_path) as conn:
                     cursor = conn.execute(
-                        'SELECT is_active FROM users WHERE user_id = ?', 
+                        'SELECT role FROM users WHERE user_id = ? AND is_active = 1', 
                         (user_id,)
                     )
                     result = cursor.fetchone()
-                    return result is not None and result[0] == 1
+                    role = result[0] if result is not None else None
+                
+                self._role_cache[user_id] = (role, now)
+                self._role_cache.move_to_end(user_id)
+                if len(self._role_cache) > ROLE_CACHE_SIZE:
+                    self._role_cache.popitem(last=False)
+                return role
         except Exception:
-            return False
+            return None
+    
+    def is_authorized(self, user_id: int) -> bool:
+        """Проверить, авторизован ли пользователь"""
+        return self.get_role(user_id) is not None
     
     def is_admin(self, user_id: int) -> bool:
         """Проверить, является ли пользователь администратором"""
-        try:
-            with self.lock:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.execute(
-                        'SELECT role FROM users WHERE user_id = ? AND is_active = 1', 
-                        (user_id,)
-                    )
-                    result = cursor.fetchone()
-                    return result is not None and result[0] == 'admin'
-        except Exception:
-            return False
+        return self.get_role(user_id) == 'admin'
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None, 
                  last_name: str = None, role: str = 'user', added_by: int = None) -> bool:
         """Добавить нового пользователя"""
         try:
             with self.lock:
+                self._invalidate_role(user_id)
                 with sqlite3.connect(self.db_path) as conn:
                     conn.execute('''
                         INSERT OR REPLACE INTO users 
@@ -125,6 +147,7 @@ class UserManager:
         """Удалить пользователя (деактивировать)"""
         try:
             with self.lock:
+                self._invalidate_role(user_id)
                 with sqlite3.connect(self.db_path) as conn:
                     cursor = conn.execute(
                         'SELECT role FROM users WHERE user_id = ?', 
@@ -151,9 +174,14 @@ class UserManager:
             return False
     
     def update_last_active(self, user_id: int):
-        """Обновить время последней активности пользователя"""
+        """Обновить время последней активности пользователя (не чаще LAST_ACTIVE_INTERVAL)"""
         try:
             with self.lock:
+                now = time.monotonic()
+                if now - self._last_active_at.get(user_id, float('-inf')) < LAST_ACTIVE_INTERVAL:
+                    return
+                self._last_active_at[user_id] = now
+                
                 with sqlite3.connect(self.db_path) as conn:
                     conn.execute(
                         'UPDATE users SET last_active = ? WHERE user_id = ?',
@@ -211,6 +239,7 @@ class UserManager:
         """Повысить пользователя до администратора"""
         try:
             with self.lock:
+                self._invalidate_role(user_id)
                 with sqlite3.connect(self.db_path) as conn:
                     conn.execute(
                         'UPDATE users SET role = "admin" WHERE user_id = ?',
@@ -225,6 +254,7 @@ class UserManager:
         """Понизить администратора до обычного пользователя"""
         try:
             with self.lock:
+                self._invalidate_role(user_id)
                 with sqlite3.connect(self.db_path) as conn:
                     # Проверяем, что это не последний админ
                     admin_count = conn.execute(
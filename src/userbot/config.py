@@ -1,10 +1,14 @@
 """
 Конфигурация для Userbot.
 """
-import os
 from dataclasses import dataclass
 from typing import Optional
 
+from config import (
+    get_userbot_credentials, USERBOT_SESSION_NAME,
+    USERBOT_WORKDIR, USERBOT_MAX_FILE_SIZE
+)
+
 
 @dataclass
 class UserbotConfig:
@@ -31,15 +35,18 @@ class UserbotConfig:
     
     @classmethod
     def from_env(cls) -> 'UserbotConfig':
-        """Создание конфигурации из переменных окружения."""
+        """Создание конфигурации из переменных окружения (через общий config.py)."""
+        credentials = get_userbot_credentials()
+        api_id = credentials["api_id"]
+        storage_chat_id = credentials["storage_chat_id"]
         return cls(
-            api_id=int(os.getenv('USERBOT_API_ID', 24073458)) or None,
-            api_hash=os.getenv('USERBOT_API_HASH', '717a1a4a14165bd46f9e066ee639a63f'),
-            phone_number=os.getenv('USERBOT_PHONE', '+992004550737'),
-            storage_chat_id=int(os.getenv('USERBOT_STORAGE_CHAT_ID', 6690844057)) or None,
-            session_name=os.getenv('USERBOT_SESSION_NAME', 'userbot_session'),
-            workdir=os.getenv('USERBOT_WORKDIR', 'sessions'),
-            max_file_size=int(os.getenv('USERBOT_MAX_FILE_SIZE', 2 * 1024 * 1024 * 1024))
+            api_id=int(api_id) if api_id else None,
+            api_hash=credentials["api_hash"],
+            phone_number=credentials["phone"],
+            storage_chat_id=int(storage_chat_id) if storage_chat_id else None,
+            session_name=USERBOT_SESSION_NAME,
+            workdir=USERBOT_WORKDIR,
+            max_file_size=USERBOT_MAX_FILE_SIZE
         )
     
     def is_configured(self) -> bool:
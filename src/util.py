@@ -0,0 +1,49 @@
+"""
+Общие вспомогательные функции
+"""
+import os
+import asyncio
+import contextlib
+
+BOT_API_FILE_LIMIT = 50 * 1024 * 1024  # 50 МБ - лимит Bot API, такие файлы читаем в память целиком
+
+# Единицы измерения размера и соответствующие им делители (1 << 10*i)
+_SIZE_UNITS = ("Б", "КБ", "МБ", "ГБ", "ТБ")
+_SIZE_DIVISORS = tuple(1 << (10 * i) for i in range(len(_SIZE_UNITS)))
+
+
+def format_size(size_bytes: int) -> str:
+    """Форматировать размер в читаемый вид"""
+    if size_bytes <= 0:
+        return "0 Б"
+    
+    # Номер единицы измерения - это номер старшего бита, делённый на 10
+    i = min((int(size_bytes).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{size_bytes / _SIZE_DIVISORS[i]:.1f} {_SIZE_UNITS[i]}"
+
+
+def _open_upload(file_path: str):
+    """
+    Открыть файл для send_document (вызывается в потоке через asyncio.to_thread):
+    файлы до BOT_API_FILE_LIMIT возвращаются байтами, большие - открытым файлом
+    """
+    file = open(file_path, 'rb')
+    try:
+        if os.fstat(file.fileno()).st_size <= BOT_API_FILE_LIMIT:
+            with file:
+                return file.read()
+    except BaseException:
+        file.close()
+        raise
+    return file
+
+
+@contextlib.asynccontextmanager
+async def upload_payload(file_path: str):
+    """Содержимое файла для send_document; открытый файл закрывается после отправки"""
+    payload = await asyncio.to_thread(_open_upload, file_path)
+    try:
+        yield payload
+    finally:
+        if not isinstance(payload, bytes):
+            payload.close()